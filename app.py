@@ -4,18 +4,32 @@ from datetime import timedelta
 from flask_redis import FlaskRedis
 
 from flask import Flask, jsonify
-from flask_smorest import Api
 from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 
+import encoding
+import metrics
+import stats
+from changes import cli as changes_cli, feed
 from db import db, redis
+from blocklist import blocklist
+from hashing import hasher
+from jobs import cli as jobs_cli, queue
+from limits import concurrency, limiter, parse_limits
+from openapi import LazyApi
+from pools import engine_options, redis_options
+from replicas import replica_binds, router
 import models
 
 from resources.store import bp as store_bp
 from resources.item import bp as item_bp
 from resources.tag import bp as tag_bp
 from resources.user import bp as user_bp
+from resources.metrics import bp as metrics_bp
+from resources.search import bp as search_bp
+from resources.changes import bp as changes_bp
+from resources.jobs import bp as jobs_bp
 
 # Set expiration for jwt token
 ACCESS_EXPIRES = timedelta(minutes=30)
@@ -39,30 +53,154 @@ def create_app(db_url=None):
     app.config["SQLALCHEMY_DATABASE_URI"] = db_url or os.getenv(
         "DATABASE_URL", "sqlite:///data.db")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["DB_POOL_SIZE"] = int(os.getenv("DB_POOL_SIZE", 5))
+    app.config["DB_MAX_OVERFLOW"] = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    app.config["DB_POOL_TIMEOUT"] = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    app.config["DB_POOL_RECYCLE"] = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    app.config["DB_POOL_PRE_PING"] = os.getenv(
+        "DB_POOL_PRE_PING", "true").lower() == "true"
+    app.config["DB_STATEMENT_TIMEOUT"] = int(
+        os.getenv("DB_STATEMENT_TIMEOUT", 0))
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+    app.config["DATABASE_REPLICA_URLS"] = [
+        url for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+        if url]
+    app.config["REPLICA_PIN_SECONDS"] = int(
+        os.getenv("REPLICA_PIN_SECONDS", 5))
+    app.config["REPLICA_CHECK_INTERVAL"] = int(
+        os.getenv("REPLICA_CHECK_INTERVAL", 10))
+    app.config["REPLICA_MAX_LAG"] = float(os.getenv("REPLICA_MAX_LAG", 5))
+    app.config["SQLALCHEMY_BINDS"] = replica_binds(
+        app.config, app.config["SQLALCHEMY_ENGINE_OPTIONS"])
     app.config["JWT_SECRET_KEY"] = os.getenv("JWT_KEY")
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = ACCESS_EXPIRES
     app.config["REDIS_URL"] = os.getenv("REDIS_URL")
+    app.config["REDIS_MAX_CONNECTIONS"] = int(
+        os.getenv("REDIS_MAX_CONNECTIONS", 50))
+    app.config["REDIS_SOCKET_TIMEOUT"] = float(
+        os.getenv("REDIS_SOCKET_TIMEOUT", 5))
+    app.config["REDIS_HEALTH_CHECK_INTERVAL"] = int(
+        os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+    app.config["SLOW_REQUEST_THRESHOLD"] = float(
+        os.getenv("SLOW_REQUEST_THRESHOLD", 0))
+    app.config["POOL_PREWARM"] = int(os.getenv("POOL_PREWARM", 2))
+    app.config["BLOCKLIST_CACHE_SIZE"] = int(
+        os.getenv("BLOCKLIST_CACHE_SIZE", 10000))
+    app.config["BLOCKLIST_NEGATIVE_TTL"] = int(
+        os.getenv("BLOCKLIST_NEGATIVE_TTL", 60))
+    app.config["BLOCKLIST_CHANNEL"] = os.getenv(
+        "BLOCKLIST_CHANNEL", "blocklist")
+    app.config["BLOCKLIST_FAIL_MODE"] = os.getenv(
+        "BLOCKLIST_FAIL_MODE", "open")
+    app.config["PASSWORD_HASH_ROUNDS"] = int(
+        os.getenv("PASSWORD_HASH_ROUNDS", 29000))
+    app.config["HASH_POOL_SIZE"] = int(os.getenv("HASH_POOL_SIZE", 2))
+    app.config["HASH_QUEUE_DEPTH"] = int(os.getenv("HASH_QUEUE_DEPTH", 8))
+    app.config["HASH_TIMEOUT"] = int(os.getenv("HASH_TIMEOUT", 5))
+    app.config["RESPONSE_CACHE_ENABLED"] = os.getenv(
+        "RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    app.config["RESPONSE_CACHE_TTL"] = int(
+        os.getenv("RESPONSE_CACHE_TTL", 300))
+    app.config["FAST_SERIALIZER"] = os.getenv(
+        "FAST_SERIALIZER", "true").lower() == "true"
+    app.config["FAST_JSON"] = os.getenv("FAST_JSON", "true").lower() == "true"
+    app.config["COMPRESS_ENABLED"] = os.getenv(
+        "COMPRESS_ENABLED", "true").lower() == "true"
+    app.config["COMPRESS_MIN_SIZE"] = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+    app.config["COMPRESS_GZIP_LEVEL"] = int(
+        os.getenv("COMPRESS_GZIP_LEVEL", 6))
+    app.config["COMPRESS_BROTLI_QUALITY"] = int(
+        os.getenv("COMPRESS_BROTLI_QUALITY", 4))
+    app.config["ITEMS_PAGE_SIZE"] = int(os.getenv("ITEMS_PAGE_SIZE", 100))
+    app.config["ITEMS_MAX_PAGE_SIZE"] = int(
+        os.getenv("ITEMS_MAX_PAGE_SIZE", 1000))
+    app.config["NESTED_COLLECTION_LIMIT"] = int(
+        os.getenv("NESTED_COLLECTION_LIMIT", 20))
+    app.config["ITEMS_STREAM_BATCH_SIZE"] = int(
+        os.getenv("ITEMS_STREAM_BATCH_SIZE", 500))
+    app.config["BULK_CHUNK_SIZE"] = int(os.getenv("BULK_CHUNK_SIZE", 1000))
+    app.config["CHANGES_STREAM"] = os.getenv("CHANGES_STREAM", "changes")
+    app.config["CHANGES_STREAM_MAXLEN"] = int(
+        os.getenv("CHANGES_STREAM_MAXLEN", 1000000))
+    app.config["JOBS_BROKER"] = os.getenv("JOBS_BROKER", "redis")
+    app.config["JOB_MAX_ATTEMPTS"] = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+    app.config["JOB_BACKOFF"] = float(os.getenv("JOB_BACKOFF", 2))
+    app.config["JOB_MAX_BACKOFF"] = float(os.getenv("JOB_MAX_BACKOFF", 300))
+    app.config["JOB_TIMEOUT"] = int(os.getenv("JOB_TIMEOUT", 600))
+    app.config["JOB_TTL"] = int(os.getenv("JOB_TTL", 86400))
+    app.config["JOB_POLL_INTERVAL"] = float(
+        os.getenv("JOB_POLL_INTERVAL", 0.5))
+    app.config["IDEMPOTENCY_TTL"] = int(os.getenv("IDEMPOTENCY_TTL", 86400))
+    app.config["RATE_LIMIT_ENABLED"] = os.getenv(
+        "RATE_LIMIT_ENABLED", "true").lower() == "true"
+    app.config["RATE_LIMITS"] = parse_limits(os.getenv(
+        "RATE_LIMITS", "default=600/60,Users=30/60,Metrics=0"))
+    app.config["MAX_IN_FLIGHT_REQUESTS"] = int(
+        os.getenv("MAX_IN_FLIGHT_REQUESTS", 0))
+    # Proxies in front of the app trusted to set X-Forwarded-For
+    app.config["PROXY_COUNT"] = int(os.getenv("PROXY_COUNT", 0))
+    # Disable where `flask db upgrade` manages the schema
+    app.config["DB_CREATE_ALL"] = os.getenv(
+        "DB_CREATE_ALL", "true").lower() == "true"
+
+    # Take client addresses from X-Forwarded-For behind trusted proxies
+    if app.config["PROXY_COUNT"]:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_COUNT"])
+
     # Initialise database
     db.init_app(app)
 
     # Initialise redis
-    redis.init_app(app)
+    redis.init_app(app, **redis_options(app.config))
+
+    # Initialise read replica routing
+    router.init_app(app)
+
+    # Initialise token blocklist cache
+    blocklist.init_app(app)
+
+    # Initialise change feed
+    feed.init_app(app)
+
+    # Initialise background job queue
+    queue.init_app(app)
 
-    # Initialise SMOREST
-    api = Api(app)
+    # Initialise password hashing pool
+    hasher.init_app(app)
+
+    # Initialise request metrics
+    metrics.init_app(app)
+
+    # Initialise response encoding, after metrics so that compression time
+    # is recorded
+    encoding.init_app(app)
+
+    # Initialise load shedding and rate limiting, after metrics so that
+    # rejected requests are recorded
+    concurrency.init_app(app)
+    limiter.init_app(app)
+
+    # Initialise SMOREST, documenting blueprints on first request for the spec
+    api = LazyApi(app)
 
     # Initialise JWT
     jwt = JWTManager(app)
 
-    # Initialise flask migrate
-    migrate = Migrate(app, db)
+    # Initialise flask migrate for `flask db`, sparing servers the alembic
+    # import
+    if os.getenv("FLASK_RUN_FROM_CLI"):
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    # Register maintenance commands
+    app.cli.add_command(stats.cli)
+    app.cli.add_command(changes_cli)
+    app.cli.add_command(jobs_cli)
 
     # Logout handler
     @jwt.token_in_blocklist_loader
     def check_if_token_in_blocklist(jwt_header, jwt_payload: dict):
-        jti = jwt_payload["jti"]
-        token_in_redis = redis.get(jti)
-        return token_in_redis is not None
+        return blocklist.is_revoked(jwt_payload["jti"], jwt_payload["exp"])
 
     # Custom error messages for JWT
     @jwt.revoked_token_loader
@@ -106,8 +244,14 @@ def create_app(db_url=None):
     api.register_blueprint(store_bp)
     api.register_blueprint(tag_bp)
     api.register_blueprint(user_bp)
+    api.register_blueprint(metrics_bp)
+    api.register_blueprint(search_bp)
+    api.register_blueprint(changes_bp)
+    api.register_blueprint(jobs_bp)
 
-    with app.app_context():
-        db.create_all()
+    if app.config["DB_CREATE_ALL"]:
+        # Replicas receive the schema from their primary
+        with app.app_context():
+            db.create_all(bind_key=None)
 
     return app
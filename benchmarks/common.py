@@ -0,0 +1,106 @@
+"""Helpers shared by the benchmark scripts"""
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("JWT_KEY", "benchmark")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+# Benchmarks drive far more requests per client than production limits allow
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from sqlalchemy import insert, select  # noqa: E402
+
+import stats  # noqa: E402
+from app import create_app  # noqa: E402
+from db import db  # noqa: E402
+from models import ItemModel, ItemTags, StoreModel, TagModel  # noqa: E402
+
+
+def seed(db_url, stores, items_per_store, tags_per_store=0, links_per_item=0):
+    """Recreates the schema and fills it with stores, items, tags and links"""
+    app = create_app(db_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(insert(StoreModel), [
+            {"name": f"store-{store}"} for store in range(stores)])
+        store_ids = db.session.scalars(
+            select(StoreModel.id).order_by(StoreModel.id)).all()
+
+        db.session.execute(insert(ItemModel), [
+            {"name": f"item-{store_id}-{item}", "price": item,
+             "store_id": store_id}
+            for store_id in store_ids for item in range(items_per_store)])
+        if tags_per_store:
+            db.session.execute(insert(TagModel), [
+                {"name": f"tag-{tag}", "store_id": store_id}
+                for store_id in store_ids for tag in range(tags_per_store)])
+
+        if links_per_item:
+            tag_ids = {}
+            for tag_id, store_id in db.session.execute(
+                    select(TagModel.id, TagModel.store_id)):
+                tag_ids.setdefault(store_id, []).append(tag_id)
+            db.session.execute(insert(ItemTags), [
+                {"item_id": item_id, "tag_id": tag_id}
+                for item_id, store_id in db.session.execute(
+                    select(ItemModel.id, ItemModel.store_id))
+                for tag_id in tag_ids.get(store_id, [])[:links_per_item]])
+        stats.rebuild()
+        db.session.commit()
+    return app
+
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + "/openapi.json").read()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("gunicorn did not start")
+
+
+def worker_memory_kb(master_pid, field="VmRSS"):
+    """Returns a /proc status field summed over gunicorn's worker processes
+
+    VmRSS is current resident memory, VmHWM the peak.
+    """
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as children:
+        pids = children.read().split()
+    total = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(f"{field}:"):
+                    total += int(line.split()[1])
+    return total
+
+
+@contextmanager
+def gunicorn(db_url, port, **env):
+    """Runs gunicorn over create_app() and yields (base url, master pid)"""
+    env = {**os.environ, "DATABASE_URL": db_url, "BIND": f"127.0.0.1:{port}",
+           **{key: str(value) for key, value in env.items()}}
+    server = subprocess.Popen(["gunicorn", "app:create_app()"], cwd=ROOT,
+                              env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        wait_until_up(base_url)
+        yield base_url, server.pid
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def percentile(values, fraction):
+    """Returns the value at fraction of the sorted values"""
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
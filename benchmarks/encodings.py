@@ -0,0 +1,113 @@
+"""Compares response representations by size on the wire and encode CPU
+
+Seeds a SQLite database and renders GET /item?limit=N and GET /store once,
+then for each representation (json with the stdlib encoder, json with
+orjson, msgpack), each optionally gzip or brotli compressed, reports the
+bytes sent and the CPU time spent encoding and compressing the body. It also
+times the full request through the app for each Accept / Accept-Encoding.
+
+Usage: python benchmarks/encodings.py [--stores 20] [--items-per-store 50]
+                                      [--limit 1000] [--repeat 50]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from json import loads
+
+from common import seed
+import encoding
+
+REQUESTS = {
+    "json": {},
+    "json+gzip": {"Accept-Encoding": "gzip"},
+    "json+br": {"Accept-Encoding": "br"},
+    "msgpack": {"Accept": "application/msgpack"},
+    "msgpack+gzip": {"Accept": "application/msgpack",
+                     "Accept-Encoding": "gzip"},
+    "msgpack+br": {"Accept": "application/msgpack", "Accept-Encoding": "br"},
+}
+
+
+def cpu_ms(function, repeat):
+    """Returns the median CPU time of function in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        function()
+        samples.append(time.process_time() - started)
+    return statistics.median(samples) * 1000
+
+
+def encoders(app):
+    """Returns {representation: function encoding a payload to bytes}"""
+    stdlib = encoding.JSONProvider(app)
+    found = {"json": lambda obj: stdlib.dumps(obj).encode()}
+    if encoding.orjson is not None:
+        fast = encoding.JSONProvider(app)
+        fast.fast = True
+        found["json (orjson)"] = lambda obj: fast.dumps(obj).encode()
+    if encoding.msgpack is not None:
+        found["msgpack"] = encoding.msgpack.packb
+    return found
+
+
+def compare_encodings(app, payload, repeat):
+    compressor = encoding.compressor
+    codecs = [None] + compressor.encodings
+    print(f"{'representation':<22}{'bytes':>10}{'encode ms':>12}")
+    for name, encode in encoders(app).items():
+        body = encode(payload)
+        for codec in codecs:
+            label = name if codec is None else f"{name}+{codec}"
+            size = len(body if codec is None
+                       else compressor.compress(body, codec))
+            used = cpu_ms(lambda: encode(payload) if codec is None
+                          else compressor.compress(encode(payload), codec),
+                          repeat)
+            print(f"{label:<22}{size:>10}{used:>12.2f}")
+
+
+def compare_requests(client, path, repeat):
+    print(f"{'request':<22}{'bytes':>10}{'cpu ms':>12}{'wall ms':>12}")
+    for name, headers in REQUESTS.items():
+        response = client.get(path, headers=headers)
+        if name.startswith("msgpack") and \
+                response.mimetype != encoding.MSGPACK:
+            continue
+        walls = []
+
+        def request():
+            started = time.perf_counter()
+            client.get(path, headers=headers).get_data()
+            walls.append(time.perf_counter() - started)
+        used = cpu_ms(request, repeat)
+        print(f"{name:<22}{len(response.get_data()):>10}{used:>12.2f}"
+              f"{statistics.median(walls) * 1000:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--items-per-store", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = seed(f"sqlite:///{tmp}/bench.db", args.stores,
+                   args.items_per_store, tags_per_store=5, links_per_item=2)
+        app.config["RESPONSE_CACHE_ENABLED"] = False
+        client = app.test_client()
+
+        for path in (f"/item?limit={args.limit}", "/store"):
+            print(f"\nGET {path}")
+            with app.app_context():
+                compare_encodings(app, loads(client.get(path).get_data()),
+                                  args.repeat)
+            print()
+            compare_requests(client, path, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
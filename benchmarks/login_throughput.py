@@ -0,0 +1,55 @@
+"""Measures /login throughput for a range of password hashing pool sizes
+
+Usage: python benchmarks/login_throughput.py [--pool-sizes 0 1 2 4]
+                                             [--clients 8] [--requests 200]
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import create_app
+from hashing import hasher
+
+
+def run(pool_size, clients, requests):
+    """Returns (logins per second, rejected logins) for one pool size"""
+    os.environ["HASH_POOL_SIZE"] = str(pool_size)
+    os.environ["HASH_QUEUE_DEPTH"] = str(max(clients, 1))
+    hasher._executor = None
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(f"sqlite:///{tmp}/bench.db")
+        client = app.test_client()
+        credentials = {"username": "bench", "password": "bench"}
+        client.post("/register", json=credentials)
+
+        def login(_):
+            return client.post("/login", json=credentials).status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            statuses = list(pool.map(login, range(requests)))
+        elapsed = time.perf_counter() - started
+
+    if hasher._executor is not None:
+        hasher._executor.shutdown()
+    return statuses.count(200) / elapsed, statuses.count(429)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pool-sizes", type=int, nargs="+",
+                        default=[0, 1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'pool size':>10} {'logins/s':>10} {'rejected':>10}")
+    for pool_size in args.pool_sizes:
+        rate, rejected = run(pool_size, args.clients, args.requests)
+        print(f"{pool_size:>10} {rate:>10.1f} {rejected:>10}")
+
+
+if __name__ == "__main__":
+    main()
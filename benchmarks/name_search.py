@@ -0,0 +1,72 @@
+"""Compares GET /search with pulling every item and filtering client-side
+
+Seeds a SQLite database, then times each query through GET /search in every
+mode and through the full scan clients did before: paging through GET /item
+and matching names locally.
+
+Usage: python benchmarks/name_search.py [--stores 200] [--items-per-store 100]
+                                        [--repeat 20] [--queries item-1 -7 ...]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from json import loads
+
+from common import seed
+
+MODES = ["prefix", "substring", "ranked"]
+
+
+def full_scan(client, query):
+    """Returns item names containing query, as a client filtering GET /item"""
+    matches, path = [], "/item?limit=1000"
+    while path:
+        response = client.get(path)
+        matches += [item["name"] for item in loads(response.get_data())
+                    if query.lower() in item["name"].lower()]
+        link = response.headers.get("Link")
+        path = link[1:link.index(">")] if link else None
+    return matches
+
+
+def timed(function, repeat):
+    """Returns the median run time of function in milliseconds"""
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stores", type=int, default=200)
+    parser.add_argument("--items-per-store", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--queries", nargs="+",
+                        default=["item-1", "-42-", "-7", "tag-3"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = seed(f"sqlite:///{tmp}/bench.db", args.stores,
+                   args.items_per_store, tags_per_store=5)
+        app.config["RESPONSE_CACHE_ENABLED"] = False
+        client = app.test_client()
+
+        columns = ["full scan"] + MODES
+        print(f"{'query':<12}" + "".join(f"{column + ' ms':>16}"
+                                         for column in columns))
+        for query in args.queries:
+            row = [timed(lambda: full_scan(client, query), args.repeat)]
+            for mode in MODES:
+                row.append(timed(lambda: client.get(
+                    "/search", query_string={"q": query, "mode": mode,
+                                             "limit": 1000}),
+                    args.repeat))
+            print(f"{query:<12}" + "".join(f"{value:>16.1f}" for value in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compares throughput and memory of the gunicorn serving modes
+
+Starts gunicorn with each SERVER_MODE against a seeded SQLite database and
+drives GET /store and GET /item from concurrent clients.
+
+Usage: python benchmarks/serving_modes.py [--modes sync threaded]
+                                          [--clients 16] [--duration 10]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from common import gunicorn, percentile, seed, worker_memory_kb
+
+PATHS = ["/store", "/item"]
+
+
+def drive(base_url, clients, duration):
+    deadline = time.monotonic() + duration
+
+    def client(number):
+        latencies = []
+        while time.monotonic() < deadline:
+            path = PATHS[len(latencies) % len(PATHS)]
+            started = time.perf_counter()
+            urllib.request.urlopen(base_url + path).read()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    with ThreadPoolExecutor(clients) as pool:
+        return [latency for latencies in pool.map(client, range(clients))
+                for latency in latencies]
+
+
+def run(mode, db_url, port, args):
+    with gunicorn(db_url, port, SERVER_MODE=mode, WEB_CONCURRENCY=args.workers,
+                  RESPONSE_CACHE_ENABLED="false") as (base_url, pid):
+        latencies = drive(base_url, args.clients, args.duration)
+        rss = worker_memory_kb(pid)
+
+    return {
+        "requests/s": len(latencies) / args.duration,
+        "p50 ms": statistics.median(latencies) * 1000,
+        "p99 ms": percentile(latencies, 0.99) * 1000,
+        "worker rss MB": rss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["sync", "threaded"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--items-per-store", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{tmp}/bench.db"
+        seed(db_url, args.stores, args.items_per_store)
+        results = {mode: run(mode, db_url, args.port, args)
+                   for mode in args.modes}
+
+    columns = list(next(iter(results.values())))
+    print(f"{'mode':<10}" + "".join(f"{column:>15}" for column in columns))
+    for mode, result in results.items():
+        print(f"{mode:<10}" + "".join(f"{result[column]:>15.1f}"
+                                      for column in columns))
+
+
+if __name__ == "__main__":
+    main()
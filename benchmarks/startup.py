@@ -0,0 +1,88 @@
+"""Measures cold start of the app and of gunicorn workers
+
+Times `import app` and create_app() in fresh interpreters with and without
+DB_CREATE_ALL, the first and a repeated GET /openapi.json, and how long
+gunicorn takes to answer its first request with and without PRELOAD_APP.
+
+Usage: python benchmarks/startup.py [--runs 5] [--workers 4]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from json import loads
+
+from common import ROOT, gunicorn, seed
+
+# Run in a fresh interpreter so that no module is imported yet
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+client = application.test_client()
+client.get("/openapi.json")
+documented = time.perf_counter()
+client.get("/openapi.json")
+print(json.dumps({"import ms": (imported - started) * 1000,
+                  "create_app ms": (created - imported) * 1000,
+                  "first spec ms": (documented - created) * 1000,
+                  "cached spec ms":
+                      (time.perf_counter() - documented) * 1000}))
+"""
+
+
+def probe(db_url, runs, **env):
+    """Returns median phase timings of runs fresh interpreters"""
+    env = {**os.environ, "DATABASE_URL": db_url, **env}
+    samples = [loads(subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, env=env, check=True,
+        capture_output=True, text=True).stdout) for _ in range(runs)]
+    return {phase: statistics.median(sample[phase] for sample in samples)
+            for phase in samples[0]}
+
+
+def time_to_first_response(db_url, port, runs, **env):
+    """Returns the median seconds from spawning gunicorn to a served request"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        with gunicorn(db_url, port, **env) as (base_url, pid):
+            urllib.request.urlopen(base_url + "/store").read()
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{tmp}/bench.db"
+        seed(db_url, 10, 10)
+
+        for create_all in ("true", "false"):
+            result = probe(db_url, args.runs, DB_CREATE_ALL=create_all)
+            print(f"DB_CREATE_ALL={create_all:<6}" + "".join(
+                f"{phase:>16} {value:>7.1f}"
+                for phase, value in result.items()))
+
+        for preload in ("false", "true"):
+            seconds = time_to_first_response(
+                db_url, args.port, args.runs, DB_CREATE_ALL="false",
+                PRELOAD_APP=preload, WEB_CONCURRENCY=args.workers)
+            print(f"PRELOAD_APP={preload:<6} {args.workers} workers, "
+                  f"first response after {seconds * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""Benchmarks every route registered by create_app()
+
+Seeds a database with configurable numbers of stores, items, tags and links,
+then sends --requests requests to each route through the Flask test client
+and through a real gunicorn process. Reports p50/p99 latency, requests/s,
+SQL statements per request (test client only) and peak RSS, and diffs the
+results against a baseline file.
+
+Usage: python benchmarks/suite.py [--db-url URL] [--stores 50]
+                                  [--items-per-store 50] [--requests 50]
+                                  [--modes testclient gunicorn]
+                                  [--save-baseline] [--fail-on-regression]
+
+GET routes are driven automatically; write routes and GET routes with
+required query arguments need an entry in SPECS and are listed as skipped
+until they have one.
+"""
+import argparse
+import logging
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from json import dump, dumps, load, loads
+
+from common import ROOT, gunicorn, percentile, seed, worker_memory_kb
+
+from passlib.hash import pbkdf2_sha256
+from sqlalchemy import event, insert, select
+
+from db import db
+from models import ItemModel, StoreModel, TagModel, UserModel
+
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+METHOD_ORDER = ["GET", "POST", "PUT", "DELETE"]
+USERNAME, PASSWORD = "benchmark", "benchmark"
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers=None, json=None, data=None,
+                content_type=None):
+        try:
+            response = self.client.open(path, method=method, headers=headers,
+                                        json=json, data=data,
+                                        content_type=content_type)
+            return response.status_code, response.get_data()
+        except Exception:
+            # PROPAGATE_EXCEPTIONS re-raises server errors in the client
+            return 500, b""
+
+
+class HttpTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def request(self, method, path, headers=None, json=None, data=None,
+                content_type=None):
+        headers = dict(headers or {})
+        if json is not None:
+            data = dumps(json)
+            content_type = "application/json"
+        if content_type:
+            headers["Content-Type"] = content_type
+        if isinstance(data, str):
+            data = data.encode()
+        request = urllib.request.Request(self.base_url + path, data=data,
+                                         headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as err:
+            return err.code, err.read()
+
+
+class Context:
+    """Sample ids and disposable rows that requests are built from"""
+
+    def __init__(self, app, transport, count):
+        self.transport = transport
+        password = pbkdf2_sha256.hash(PASSWORD)
+        with app.app_context():
+            store = db.session.scalars(select(StoreModel).limit(1)).one()
+            self.ids = {
+                "store_id": store.id,
+                "item_id": db.session.scalars(select(ItemModel.id).where(
+                    ItemModel.store_id == store.id).limit(1)).one(),
+                "tag_id": db.session.scalars(select(TagModel.id).where(
+                    TagModel.store_id == store.id).limit(1)).one(),
+            }
+            self.pools = {
+                "stores": self._create(StoreModel, [
+                    {"name": f"disposable-{number}"}
+                    for number in range(count)]),
+                "items": self._create(ItemModel, [
+                    {"name": f"disposable-{number}", "price": 1,
+                     "store_id": store.id} for number in range(count)]),
+                "link_items": self._create(ItemModel, [
+                    {"name": f"linkable-{number}", "price": 1,
+                     "store_id": store.id} for number in range(count)]),
+                "tags": self._create(TagModel, [
+                    {"name": f"disposable-{number}", "store_id": store.id}
+                    for number in range(count)]),
+                "users": self._create(UserModel, [
+                    {"username": f"disposable-{number}",
+                     "password": password}
+                    for number in range(count)]),
+            }
+            self.ids["user_id"] = self._create(UserModel, [
+                {"username": USERNAME, "password": password}])[0]
+            db.session.commit()
+        self.headers = self.login()
+
+    @staticmethod
+    def _create(model, rows):
+        db.session.execute(insert(model), rows)
+        names = [row.get("name", row.get("username")) for row in rows]
+        column = model.username if model is UserModel else model.name
+        return db.session.scalars(select(model.id).where(
+            column.in_(names)).order_by(model.id)).all()
+
+    def login(self):
+        status, body = self.transport.request(
+            "POST", "/login",
+            json={"username": USERNAME, "password": PASSWORD})
+        return {"Authorization": f"Bearer {loads(body)['access_token']}"}
+
+
+# Request builders for write routes and GET routes taking required
+# arguments: (iteration, context) -> request kwargs
+SPECS = {
+    "GET /search": lambda n, ctx: {"path": f"/search?q=item-{n % 10}"},
+    "POST /store": lambda n, ctx: {"json": {"name": f"new-store-{n}"}},
+    "DELETE /store/<int:store_id>": lambda n, ctx: {
+        "path": f"/store/{ctx.pools['stores'][n]}"},
+    "POST /item": lambda n, ctx: {"json": {
+        "name": f"new-item-{n}", "price": 1,
+        "store_id": ctx.ids["store_id"]}},
+    "PUT /item/<int:item_id>": lambda n, ctx: {"json": {
+        "name": f"renamed-{ctx.ids['item_id']}", "price": n}},
+    "DELETE /item/<int:item_id>": lambda n, ctx: {
+        "path": f"/item/{ctx.pools['items'][n]}"},
+    "POST /item/bulk": lambda n, ctx: {
+        "content_type": "application/x-ndjson",
+        "data": "\n".join(dumps({
+            "name": f"bulk-{n}-{row}", "price": row,
+            "store_id": ctx.ids["store_id"]}) for row in range(10))},
+    "POST /store/<int:store_id>/tag": lambda n, ctx: {
+        "json": {"name": f"new-tag-{n}"}},
+    "DELETE /tag/<int:tag_id>": lambda n, ctx: {
+        "path": f"/tag/{ctx.pools['tags'][n]}"},
+    "POST /item/<int:item_id>/tag/<int:tag_id>": lambda n, ctx: {
+        "path": f"/item/{ctx.pools['link_items'][n]}/tag/{ctx.ids['tag_id']}"},
+    "DELETE /item/<int:item_id>/tag/<int:tag_id>": lambda n, ctx: {
+        "path": f"/item/{ctx.pools['link_items'][n]}/tag/{ctx.ids['tag_id']}"},
+    "POST /item/tags": lambda n, ctx: {"json": {"links": [
+        {"item_id": item_id, "tag_id": ctx.ids["tag_id"]}
+        for item_id in ctx.pools["link_items"][n:n + 10]]}},
+    "DELETE /item/tags": lambda n, ctx: {"json": {"links": [
+        {"item_id": item_id, "tag_id": ctx.ids["tag_id"]}
+        for item_id in ctx.pools["link_items"][n:n + 10]]}},
+    "DELETE /user/<int:user_id>": lambda n, ctx: {
+        "path": f"/user/{ctx.pools['users'][n]}"},
+    "POST /register": lambda n, ctx: {
+        "json": {"username": f"new-user-{n}", "password": PASSWORD}},
+    "POST /login": lambda n, ctx: {
+        "json": {"username": USERNAME, "password": PASSWORD}},
+    "DELETE /logout": lambda n, ctx: {"headers": ctx.login()},
+}
+
+
+def routes(app):
+    """Returns (key, rule, method) for every route, reads before writes"""
+    found = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == "static":
+            continue
+        for method in rule.methods - {"HEAD", "OPTIONS"}:
+            found.append((f"{method} {rule.rule}", rule, method))
+    return sorted(found, key=lambda route: (METHOD_ORDER.index(route[2]),
+                                            route[0]))
+
+
+def build(key, rule, method, number, ctx):
+    """Returns request kwargs for one iteration, or None if not drivable"""
+    if key in SPECS:
+        spec = SPECS[key](number, ctx)
+    elif method == "GET":
+        spec = {}
+    else:
+        return None
+
+    if "path" not in spec:
+        if not set(rule.arguments) <= ctx.ids.keys():
+            return None
+        spec["path"] = rule.build(
+            {name: ctx.ids[name] for name in rule.arguments},
+            append_unknown=False)[1]
+    spec.setdefault("headers", ctx.headers)
+    return spec
+
+
+def run(app, transport, count, count_queries):
+    ctx = Context(app, transport, count)
+    statements = [0]
+
+    def count_statement(*args):
+        statements[0] += 1
+
+    if count_queries:
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", count_statement)
+
+    results, skipped = {}, []
+    for key, rule, method in routes(app):
+        if build(key, rule, method, 0, ctx) is None:
+            skipped.append(key)
+            continue
+
+        latencies, errors = [], 0
+        statements[0] = 0
+        for number in range(count):
+            spec = build(key, rule, method, number, ctx)
+            started = time.perf_counter()
+            status, _ = transport.request(method, **spec)
+            latencies.append(time.perf_counter() - started)
+            errors += status >= 500
+
+        results[key] = {
+            "requests/s": count / sum(latencies),
+            "p50 ms": statistics.median(latencies) * 1000,
+            "p99 ms": percentile(latencies, 0.99) * 1000,
+            "errors": errors,
+        }
+        if count_queries:
+            results[key]["queries"] = statements[0] / count
+
+    if count_queries:
+        with app.app_context():
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+    return results, skipped
+
+
+def print_results(mode, results, peak_rss_kb, baseline, tolerance):
+    """Prints results next to the baseline, returning the regressed routes"""
+    columns = ["requests/s", "p50 ms", "p99 ms", "queries", "errors"]
+    print(f"\n{mode} (peak rss {peak_rss_kb / 1024:.1f} MB)")
+    print(f"{'route':<48}" + "".join(f"{column:>12}" for column in columns)
+          + f"{'p50 vs base':>14}")
+
+    regressions = []
+    for key, result in results.items():
+        row = f"{key:<48}" + "".join(
+            f"{result[column]:>12.1f}" if column in result else f"{'-':>12}"
+            for column in columns)
+        base = baseline.get(mode, {}).get("routes", {}).get(key)
+        if base:
+            change = result["p50 ms"] / base["p50 ms"] - 1
+            row += f"{change:>+13.0%}"
+            if change > tolerance or \
+                    result.get("queries", 0) > base.get("queries", 0):
+                regressions.append(f"{mode} {key}")
+                row += " !"
+        print(row)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", help="database to reset and seed, "
+                        "defaults to a temporary SQLite file")
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--items-per-store", type=int, default=50)
+    parser.add_argument("--tags-per-store", type=int, default=5)
+    parser.add_argument("--links-per-item", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--modes", nargs="+",
+                        default=["testclient", "gunicorn"],
+                        choices=["testclient", "gunicorn"])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p50 slowdown before flagging a route")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    tmp = None if args.db_url else tempfile.mkdtemp()
+    db_url = args.db_url or f"sqlite:///{tmp}/benchmark.db"
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = load(baseline_file)
+
+    report, regressions = {}, []
+    for mode in args.modes:
+        app = seed(db_url, args.stores, args.items_per_store,
+                   args.tags_per_store, args.links_per_item)
+        app.logger.setLevel(logging.ERROR)
+        if mode == "testclient":
+            results, skipped = run(app, TestClientTransport(app),
+                                   args.requests, count_queries=True)
+            peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        else:
+            with gunicorn(db_url, args.port) as (base_url, pid):
+                results, skipped = run(app, HttpTransport(base_url),
+                                       args.requests, count_queries=False)
+                peak_rss_kb = worker_memory_kb(pid, "VmHWM")
+
+        report[mode] = {"routes": results, "peak_rss_kb": peak_rss_kb}
+        regressions += print_results(mode, results, peak_rss_kb, baseline,
+                                     args.tolerance)
+        if skipped:
+            print("skipped, no request spec: " + ", ".join(skipped))
+
+    if tmp:
+        shutil.rmtree(tmp)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            dump(report, baseline_file, indent=2, sort_keys=True)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    if regressions:
+        print("\nRegressed against baseline: " + ", ".join(regressions))
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Per-worker cache of revoked JWTs in front of the redis blocklist
+
+Lookups are answered from a bounded LRU of jti -> revoked entries which age
+out with the token's own `exp`. Revocations are published on a redis channel
+so every worker updates its copy; if redis is unreachable, cached answers are
+still served and unknown tokens follow BLOCKLIST_FAIL_MODE.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from redis.exceptions import RedisError
+
+from db import redis
+
+
+class TokenBlocklist:
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxsize = app.config["BLOCKLIST_CACHE_SIZE"]
+        self.negative_ttl = app.config["BLOCKLIST_NEGATIVE_TTL"]
+        self.channel = app.config["BLOCKLIST_CHANNEL"]
+        self.fail_closed = app.config["BLOCKLIST_FAIL_MODE"] == "closed"
+        self.expires = app.config["JWT_ACCESS_TOKEN_EXPIRES"]
+        self.logger = app.logger
+
+    def _get(self, jti):
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[jti]
+                return None
+            self._entries.move_to_end(jti)
+            return entry[0]
+
+    def _put(self, jti, revoked, expires_at):
+        with self._lock:
+            # A revocation received while redis was read is kept
+            entry = self._entries.get(jti)
+            if revoked or entry is None or not entry[0]:
+                self._entries[jti] = (revoked, expires_at)
+            self._entries.move_to_end(jti)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _on_message(self, message):
+        jti = message["data"]
+        if isinstance(jti, bytes):
+            jti = jti.decode()
+        self._put(jti, True, time.time() + self.expires.total_seconds())
+
+    def _on_listener_error(self, error, pubsub, thread):
+        # Revocations may be missed while disconnected, so drop what we know
+        self.logger.warning("Blocklist listener stopped: %s", error)
+        with self._lock:
+            self._entries.clear()
+        thread.stop()
+
+    def _ensure_listener(self):
+        # Started lazily so each forked worker runs its own subscriber thread
+        if self._listener is not None and self._listener.is_alive():
+            return True
+        try:
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._on_message})
+            self._listener = pubsub.run_in_thread(
+                sleep_time=1, daemon=True,
+                exception_handler=self._on_listener_error)
+            return True
+
+        except RedisError:
+            return False
+
+    def is_revoked(self, jti, exp):
+        """Returns True if the token has been revoked"""
+        listening = self._ensure_listener()
+
+        revoked = self._get(jti)
+        if revoked is not None:
+            return revoked
+
+        try:
+            revoked = redis.get(jti) is not None
+
+        except RedisError:
+            self.logger.warning("Blocklist unreachable, failing %s",
+                                "closed" if self.fail_closed else "open")
+            return self.fail_closed
+
+        if revoked:
+            self._put(jti, True, exp)
+        elif listening:
+            self._put(jti, False, min(exp, time.time() + self.negative_ttl))
+        return revoked
+
+    def revoke(self, jti, exp):
+        """Revokes a token in this worker, redis and every other worker"""
+        # Stored in redis first, so no worker holds a revocation alone
+        redis.set(jti, "", ex=self.expires)
+        self._put(jti, True, exp)
+        redis.publish(self.channel, jti)
+
+
+blocklist = TokenBlocklist()
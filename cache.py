@@ -0,0 +1,118 @@
+"""Read-through response cache for GET endpoints, backed by redis
+
+Every cached response is stored together with the version of the entity it
+was rendered from. Write handlers bump that version after committing, so a
+stale entry is never served even if it was written by a concurrent reader.
+Deletes cascading to more entities than are worth bumping one by one, such
+as a store's, bump the CASCADE version instead, which every entry is also
+stored under.
+"""
+import json
+from functools import wraps
+from hashlib import sha1
+
+from flask import current_app, request
+from redis.exceptions import RedisError
+
+from db import redis
+from encoding import negotiated, response_mimetype
+from replicas import pinned_to_primary, served_from_replica
+
+# Version bumped by any write that changes the GET /store listing
+CATALOG = ("catalog", None)
+
+# Version bumped by deletes cascading to many entities, expiring every entry
+CASCADE = ("cascade", None)
+
+# Response headers replayed with cached bodies, such as pagination links
+CACHED_HEADERS = ("Link",)
+
+
+def version_key(entity, entity_id=None):
+    """Returns redis key holding the version of an entity"""
+    if entity_id is None:
+        return f"version:{entity}"
+    return f"version:{entity}:{entity_id}"
+
+
+def invalidate(*entities):
+    """Bumps versions of (entity, id) pairs, expiring their cached responses"""
+    if not current_app.config["RESPONSE_CACHE_ENABLED"]:
+        return
+
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for entity, entity_id in set(entities):
+            pipe.incr(version_key(entity, entity_id))
+        pipe.execute()
+
+    except RedisError:
+        current_app.logger.warning("Could not invalidate %s", entities)
+
+
+def cached(entity, view_arg=None):
+    """Caches a view's 200 responses under the version of an entity
+
+    The entity id is read from the `view_arg` URL parameter. Each negotiated
+    representation is cached separately, along with the CACHED_HEADERS the
+    view set. Responses carry the view's ETag, or else a hash of the body, and
+    requests with a matching If-None-Match get a 304. Clients pinned to the
+    primary after a write bypass the cache.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Entries may come from a replica behind the client's writes
+            if (not current_app.config["RESPONSE_CACHE_ENABLED"]
+                    or pinned_to_primary()):
+                return func(*args, **kwargs)
+
+            mimetype = response_mimetype()
+            # v2 entries carry headers before the body
+            key = f"response:v2:{mimetype}:{request.full_path}"
+            try:
+                version, cascade, entry = redis.mget(
+                    version_key(entity, kwargs.get(view_arg)),
+                    version_key(*CASCADE), key)
+            except RedisError:
+                return func(*args, **kwargs)
+
+            version = (cascade or b"0") + b"." + (version or b"0")
+            if entry:
+                entry_version, etag, rest = entry.split(b":", 2)
+                if entry_version == version:
+                    # Header values cannot hold a newline
+                    headers, body = rest.split(b"\n", 1)
+                    response = current_app.response_class(
+                        body, mimetype=mimetype, headers=json.loads(headers))
+                    response.set_etag(etag.decode())
+                    return negotiated(response).make_conditional(request)
+
+            response = func(*args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+            body = response.get_data()
+            # Kept when the view tags the response itself, as with versions
+            etag = response.get_etag()[0] or sha1(body).hexdigest()
+            response.set_etag(etag)
+            # A replica may not have the write behind the current version yet
+            ttl = current_app.config["RESPONSE_CACHE_TTL"]
+            if served_from_replica():
+                max_lag = int(current_app.config["REPLICA_MAX_LAG"])
+                ttl = min(ttl, max(max_lag, 1))
+            headers = json.dumps({name: response.headers[name]
+                                  for name in CACHED_HEADERS
+                                  if name in response.headers})
+            try:
+                redis.set(key, b":".join((version, etag.encode(),
+                                          headers.encode() + b"\n" + body)),
+                          ex=ttl)
+            except RedisError:
+                pass
+
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
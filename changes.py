@@ -0,0 +1,139 @@
+"""Feed of catalog changes, published to a redis stream after commit
+
+Write handlers record compact events (entity, op, id and the ids it refers
+to) on the session. Once the transaction commits they are appended to the
+CHANGES_STREAM redis stream, capped at about CHANGES_STREAM_MAXLEN entries;
+events of rolled back transactions are dropped. A store delete event also
+stands for the deletion of the store's items, tags and their links, which
+get no events of their own. Consumers read the stream directly or through
+GET /changes, using stream entry ids as cursors.
+
+If redis is unreachable, events are written to the change_outbox table. The
+worker relays them before publishing anything else once redis is back, and
+`flask changes relay` drains outboxes left by other workers. Events from
+different workers can therefore reach the stream out of commit order.
+Delivery is at least once.
+"""
+import json
+
+import click
+from flask.cli import AppGroup
+from redis.exceptions import RedisError
+from sqlalchemy import delete, event, insert, select
+
+from db import RoutingSession, db, redis
+from models import ChangeOutboxModel
+
+
+def _cursor(entry_id):
+    """Returns a stream entry id as a comparable (milliseconds, sequence)"""
+    milliseconds, _, sequence = entry_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class ChangeFeed:
+    def __init__(self, app=None):
+        self._outbox_pending = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.stream = app.config["CHANGES_STREAM"]
+        self.maxlen = app.config["CHANGES_STREAM_MAXLEN"]
+        self.logger = app.logger
+
+    def record(self, entity, op, entity_id=None, **refs):
+        """Records a change to publish when the current transaction commits"""
+        fields = {"entity": entity, "op": op, "id": entity_id, **refs}
+        db.session.info.setdefault("changes", []).append(
+            {name: value for name, value in fields.items()
+             if value is not None})
+
+    def _append(self, events):
+        pipe = redis.pipeline(transaction=False)
+        for fields in events:
+            pipe.xadd(self.stream, fields, maxlen=self.maxlen,
+                      approximate=True)
+        pipe.execute()
+
+    def publish(self, events):
+        """Appends events to the stream, or to the outbox if redis is down"""
+        try:
+            # Keep this worker's events in order behind those it queued
+            if self._outbox_pending:
+                self.relay()
+            self._append(events)
+
+        except RedisError as err:
+            self.logger.warning("Queued %d changes in outbox: %s",
+                                len(events), err)
+            with db.engine.begin() as connection:
+                connection.execute(insert(ChangeOutboxModel), [
+                    {"event": json.dumps(fields)} for fields in events])
+            self._outbox_pending = True
+
+    def relay(self, batch_size=1000):
+        """Moves events from the outbox to the stream, returning the count
+
+        Raises RedisError if redis is unreachable, leaving the rest queued.
+        """
+        relayed = 0
+        while True:
+            with db.engine.begin() as connection:
+                rows = connection.execute(
+                    select(ChangeOutboxModel.id, ChangeOutboxModel.event)
+                    .order_by(ChangeOutboxModel.id).limit(batch_size)
+                    .with_for_update(skip_locked=True)).all()
+                if not rows:
+                    break
+                self._append([json.loads(row.event) for row in rows])
+                connection.execute(delete(ChangeOutboxModel).where(
+                    ChangeOutboxModel.id.in_([row.id for row in rows])))
+            relayed += len(rows)
+        self._outbox_pending = False
+        return relayed
+
+    def read(self, since, limit):
+        """Returns up to limit changes after cursor since
+
+        Returns None if changes after since were trimmed from the stream.
+        """
+        pipe = redis.pipeline(transaction=False)
+        pipe.xrange(self.stream, "-", "+", count=1)
+        pipe.xrange(self.stream, "-" if since == "0" else f"({since}", "+",
+                    count=limit)
+        first, entries = pipe.execute()
+
+        if first and since != "0" and \
+                _cursor(since) < _cursor(first[0][0].decode()):
+            return None
+        return [{"cursor": entry_id.decode(),
+                 **{name.decode(): value.decode()
+                    for name, value in fields.items()}}
+                for entry_id, fields in entries]
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _publish_recorded(session):
+    events = session.info.pop("changes", None)
+    if events:
+        feed.publish(events)
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def _discard_recorded(session, previous_transaction):
+    session.info.pop("changes", None)
+
+
+feed = ChangeFeed()
+
+cli = AppGroup("changes", help="Manage the change feed.")
+
+
+@cli.command("relay")
+def relay_command():
+    """Publish changes queued in the outbox while redis was down."""
+    try:
+        click.echo(f"Relayed {feed.relay()} changes.")
+    except RedisError as err:
+        raise click.ClickException(f"Could not reach redis: {err}")
@@ -0,0 +1,23 @@
+"""Identifies the client behind a request
+
+Clients sending a valid JWT are identified by its identity, others by remote
+address. Behind proxies, PROXY_COUNT makes the remote address the one they
+forward in X-Forwarded-For rather than the last proxy's.
+"""
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+
+def client_id():
+    """Returns "user:<identity>" or "ip:<address>" for the current request"""
+    if "client_id" not in g:
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except (JWTExtendedException, PyJWTError):
+            identity = None
+        g.client_id = (f"user:{identity}" if identity is not None
+                       else f"ip:{request.remote_addr}")
+    return g.client_id
@@ -1,8 +1,29 @@
+from flask import g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_redis import FlaskRedis
+from sqlalchemy.dialects import postgresql, sqlite
+
+from metrics import InstrumentedRedis
+
+
+class RoutingSession(Session):
+    """Session sending SELECTs to the replica chosen for the request"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() \
+                and "read_bind" in g and getattr(clause, "is_select", False):
+            return g.read_bind
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind,
+                                **kwargs)
+
+
+# Dialects supporting INSERT ... ON CONFLICT ... RETURNING
+UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+
 
 # Create SQLAlchemy instance
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # Create Redis instance
-redis = FlaskRedis()
\ No newline at end of file
+redis = FlaskRedis.from_custom_provider(InstrumentedRedis)
\ No newline at end of file
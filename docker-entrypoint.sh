@@ -1,5 +1,18 @@
 #!/bin/sh
 
-flask db upgrade
+# The schema is managed by migrations, not create_all() at app start
+export DB_CREATE_ALL=false
 
-exec gunicorn --bind 0.0.0.0:80 "app:create_app()"
\ No newline at end of file
+# `docker-entrypoint.sh worker` runs background jobs instead of serving
+if [ "$1" = "worker" ]; then
+    exec flask jobs work
+fi
+
+# Skip when migrations are run once per deploy instead of per container
+if [ "${RUN_MIGRATIONS:-true}" = "true" ]; then
+    flask db upgrade
+fi
+
+# Worker class, threads, preloading and bind address are read from
+# gunicorn.conf.py
+exec gunicorn "app:create_app()"
@@ -0,0 +1,146 @@
+"""Collections embedded in store and tag responses, capped in size
+
+StoreSchema embeds a store's items and tags, and TagSchema a tag's items,
+but only the first NESTED_COLLECTION_LIMIT of each by id. item_count and
+tag_count give the full sizes, and items_url and tags_url point at the
+keyset-paginated sub-resources listing everything.
+
+load() fills the capped collections of many parents with one query per
+relationship. The query ranks children per parent with window functions,
+which also count them, and loads just the child columns requested, as in
+`fields=items.name`. When only a count is requested, it is computed with
+GROUP BY instead.
+"""
+from flask import current_app
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
+
+from db import db
+
+# Parents per query, as selectinload batches them
+BATCH_SIZE = 500
+
+
+def _partition(parent_class, relationship):
+    """Returns the column holding the parent id of relationship's children,
+    and a select of the children to add it to"""
+    target = relationship.mapper.class_
+    if relationship.secondary is None:
+        (_, column), = relationship.local_remote_pairs
+        return column, select(target)
+
+    column = next(remote for local, remote in relationship.local_remote_pairs
+                  if local.table is parent_class.__table__)
+    return column, select(target).join(relationship.secondary,
+                                       relationship.secondaryjoin)
+
+
+def _totals(parent):
+    if "collection_totals" not in vars(parent):
+        parent.collection_totals = {}
+    return parent.collection_totals
+
+
+def load_first(parents, name, limit, fields=None):
+    """Loads the first limit children by id of each parent's collection name
+
+    With fields, a set of child field names, only their columns are loaded.
+    """
+    parent_class = type(parents[0])
+    relationship = inspect(parent_class).relationships[name]
+    target = relationship.mapper.class_
+    column, children = _partition(parent_class, relationship)
+
+    loaded = {parent.id: [] for parent in parents}
+    totals = dict.fromkeys(loaded, 0)
+    # Computed fields may read any column
+    if fields is not None and fields.issubset(
+            relationship.mapper.column_attrs.keys()):
+        children = children.with_only_columns(
+            target.id, *(getattr(target, field)
+                         for field in sorted(fields - {"id"})),
+            maintain_column_froms=True)
+    ids = list(loaded)
+    for start in range(0, len(ids), BATCH_SIZE):
+        ranked = children.add_columns(
+            column.label("parent_id"),
+            func.row_number().over(partition_by=column,
+                                   order_by=target.id).label("position"),
+            func.count().over(partition_by=column).label("total"),
+        ).where(column.in_(ids[start:start + BATCH_SIZE])).subquery()
+        child = aliased(target, ranked)
+        for row in db.session.execute(
+                select(child, ranked.c.parent_id, ranked.c.total)
+                .where(ranked.c.position <= limit)
+                .order_by(ranked.c.parent_id, ranked.c.position)):
+            loaded[row.parent_id].append(row[0])
+            totals[row.parent_id] = row.total
+
+    for parent in parents:
+        set_committed_value(parent, name, loaded[parent.id])
+        _totals(parent)[name] = totals[parent.id]
+
+
+def load_totals(parents, name):
+    """Counts the children of each parent's collection name"""
+    parent_class = type(parents[0])
+    relationship = inspect(parent_class).relationships[name]
+    column, _ = _partition(parent_class, relationship)
+
+    totals = dict.fromkeys((parent.id for parent in parents), 0)
+    ids = list(totals)
+    for start in range(0, len(ids), BATCH_SIZE):
+        totals.update(db.session.execute(
+            select(column, func.count()).where(
+                column.in_(ids[start:start + BATCH_SIZE])).group_by(
+                    column)).all())
+    for parent in parents:
+        _totals(parent)[name] = totals[parent.id]
+
+
+def _wanted(only, name):
+    return only is None or name in only or any(
+        path.startswith(f"{name}.") for path in only)
+
+
+def _subfields(only, name):
+    """Returns the fields of collection name's children in only, or None for
+    all of them"""
+    if only is None or name in only:
+        return None
+    return {path.partition(".")[2] for path in only
+            if path.startswith(f"{name}.")}
+
+
+def field_names(collections):
+    """Returns the fields load() fills or derives for collections"""
+    return frozenset((*collections, *collections.values(),
+                      *(f"{name}_url" for name in collections)))
+
+
+def load(parents, only, collections):
+    """Loads what only requests of parents' capped collections
+
+    collections maps relationship names to the fields counting them.
+    """
+    if not parents:
+        return
+    limit = current_app.config["NESTED_COLLECTION_LIMIT"]
+    for name, count_field in collections.items():
+        if _wanted(only, name):
+            load_first(parents, name, limit, _subfields(only, name))
+        elif _wanted(only, count_field):
+            load_totals(parents, name)
+
+
+def total(name):
+    """Returns a function reading the size of a parent's collection name"""
+    def read(parent):
+        totals = vars(parent).get("collection_totals", {})
+        if name in totals:
+            return totals[name]
+        # Collections of stores and tags just created, left to load lazily
+        return len(getattr(parent, name))
+
+    return read
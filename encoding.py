@@ -0,0 +1,139 @@
+"""Response representations: JSON, MessagePack and compressed transfer
+
+Responses are encoded by the app's JSON provider. With FAST_JSON it encodes
+through orjson, producing the same documents several times faster; keys stay
+sorted, but non-ASCII text is sent as UTF-8 rather than \\u escapes. Clients
+preferring application/msgpack in Accept, such as internal services, get
+MessagePack instead, and responses vary on Accept for shared caches.
+Streamed responses are always JSON.
+
+Bodies of at least COMPRESS_MIN_SIZE bytes are compressed with brotli or
+gzip, whichever Accept-Encoding prefers, at levels chosen for CPU rather than
+ratio. Compressed responses carry a weak ETag, which conditional requests
+still match. orjson, msgpack and brotli are optional; without them the
+matching feature is off.
+"""
+import gzip
+
+from flask import has_request_context, request
+from flask.json.provider import DefaultJSONProvider, _default
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack")
+
+COMPRESSIBLE_TYPES = {JSON, MSGPACK, "application/x-ndjson"}
+
+
+def response_mimetype():
+    """Returns the representation the current request negotiated"""
+    if msgpack is None or not has_request_context():
+        return JSON
+    best = request.accept_mimetypes.best_match((JSON, *MSGPACK_TYPES),
+                                               default=JSON)
+    return MSGPACK if best in MSGPACK_TYPES else JSON
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Encodes with orjson when enabled and answers msgpack when preferred"""
+    fast = False
+
+    def dumps(self, obj, **kwargs):
+        # Indented output is only asked for in debug mode
+        if not self.fast or kwargs.get("indent"):
+            return super().dumps(obj, **kwargs)
+        # Validation errors key list positions by int
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SORT_KEYS
+                            | orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        if not self.fast or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if response_mimetype() != MSGPACK:
+            response = super().response(*args, **kwargs)
+        else:
+            obj = self._prepare_response_obj(args, kwargs)
+            response = self._app.response_class(
+                msgpack.packb(obj, default=_default), mimetype=MSGPACK)
+        return negotiated(response)
+
+
+def negotiated(response):
+    """Marks a response whose format was chosen from Accept as such"""
+    if msgpack is not None:
+        response.vary.add("Accept")
+    return response
+
+
+def _compressible(response):
+    return (response.status_code == 200
+            and not response.direct_passthrough
+            and not response.is_streamed
+            and "Content-Encoding" not in response.headers
+            and (response.mimetype in COMPRESSIBLE_TYPES
+                 or response.mimetype.startswith("text/")))
+
+
+class Compressor:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config["COMPRESS_MIN_SIZE"]
+        self.gzip_level = app.config["COMPRESS_GZIP_LEVEL"]
+        self.brotli_quality = app.config["COMPRESS_BROTLI_QUALITY"]
+        self.encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+        if app.config["COMPRESS_ENABLED"]:
+            app.after_request(self._compress)
+
+    def compress(self, body, encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def _compress(self, response):
+        if not _compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+
+        encoding = request.accept_encodings.best_match(self.encodings)
+        body = response.get_data()
+        if encoding is None or len(body) < self.min_size:
+            return response
+
+        response.set_data(self.compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def init_app(app):
+    """Plugs the JSON provider and compression into app"""
+    provider = JSONProvider(app)
+    provider.fast = app.config["FAST_JSON"] and orjson is not None
+    app.json = provider
+    compressor.init_app(app)
+
+
+compressor = Compressor()
@@ -0,0 +1,119 @@
+"""Sparse fieldsets: the `fields` and `expand` query parameters of GETs
+
+`fields` lists the fields to return, comma separated, with dotted paths
+selecting fields of related objects (`items.name`). `expand` lists
+relationships to return whole, and `expand=` returns none. Given only
+`expand`, every plain field is returned along with the listed
+relationships, except counts and links describing relationships not listed;
+given neither, responses are unchanged.
+
+Both resolve to the `only` of the response schema, which prunes the dump
+and, through load_options(), the SQL: just the requested columns are loaded
+and just the requested relationships, so GET /store?expand= is a single
+query over stores.
+"""
+from functools import lru_cache
+
+from flask_smorest import abort
+from marshmallow import fields
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+
+class Sparse:
+    """A view result to dump with only some fields of the response schema"""
+    __slots__ = ("value", "only")
+
+    def __init__(self, value, only):
+        self.value = value
+        self.only = only
+
+
+@lru_cache(maxsize=None)
+def _fields(schema_class):
+    """Returns dumped field names, {name: nested schema} of relationships and
+    {name: relationship} of fields describing a relationship's collection"""
+    dump_fields = schema_class().dump_fields
+    related, collections = {}, {}
+    for name, field in dump_fields.items():
+        inner = field.inner if isinstance(field, fields.List) else field
+        if isinstance(inner, fields.Nested):
+            related[name] = inner.schema
+        elif "collection" in field.metadata:
+            collections[name] = field.metadata["collection"]
+    return set(dump_fields), related, collections
+
+
+def _names(value):
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+def resolve(schema_class, args):
+    """Returns the `only` requested for schema_class, or None for all fields"""
+    requested, expand = _names(args.get("fieldset")), args.get("expand")
+    if not requested and expand is None:
+        return None
+
+    dump_fields, related, collections = _fields(schema_class)
+    expand = set(_names(expand))
+    for name in expand - related.keys():
+        abort(400, message=f"Cannot expand {name}.")
+
+    only = set(expand)
+    if not requested:
+        only.update(name for name in dump_fields if name not in related and (
+            name not in collections or collections[name] in expand))
+    for path in requested:
+        name, _, rest = path.partition(".")
+        if name not in dump_fields or rest and (
+                name not in related or rest not in related[name].dump_fields):
+            abort(400, message=f"Unknown field {path}.")
+        # Expanded relationships are returned whole
+        if name not in expand:
+            only.add(path)
+    return frozenset(only)
+
+
+def _options(model, paths, exclude=()):
+    mapper = inspect(model)
+    columns, related, computed = [], {}, False
+    for path in paths:
+        name, _, rest = path.partition(".")
+        if name in exclude:
+            continue
+        if name in mapper.relationships:
+            related.setdefault(name, set())
+            if rest:
+                related[name].add(rest)
+        elif name in mapper.column_attrs:
+            columns.append(getattr(model, name))
+        else:
+            computed = True
+
+    options = []
+    # Computed fields may read any column
+    if not computed:
+        primary_key = [getattr(model, prop.key) for prop in mapper.column_attrs
+                       if prop.columns[0].primary_key]
+        options.append(load_only(*columns, *primary_key))
+    for name, subpaths in related.items():
+        relationship = mapper.relationships[name]
+        loader = selectinload if relationship.uselist else joinedload
+        option = loader(getattr(model, name))
+        if subpaths:
+            option = option.options(
+                *_options(relationship.mapper.class_, subpaths))
+        options.append(option)
+    return options
+
+
+def load_options(model, only, default=(), exclude=()):
+    """Returns loader options fetching the fields in only from model
+
+    Columns outside only are deferred and relationships outside it are not
+    loaded. Fields named in exclude are left to the caller to load. With
+    only None, returns default.
+    """
+    if only is None:
+        return default
+    return _options(model, only, exclude)
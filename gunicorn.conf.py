@@ -0,0 +1,36 @@
+"""Gunicorn settings, read from the environment
+
+SERVER_MODE selects how a worker handles requests: "sync" serves one request
+at a time, "threaded" serves GUNICORN_THREADS requests concurrently so a
+worker keeps serving while others wait on the database or redis.
+
+PRELOAD_APP=true builds the app once in the master before forking, so
+workers start faster and share its memory; each worker then replaces the
+database and redis pools it inherited.
+"""
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:80")
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+preload_app = os.getenv("PRELOAD_APP", "false").lower() == "true"
+
+if os.getenv("SERVER_MODE", "sync") == "threaded":
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", 8))
+else:
+    worker_class = "sync"
+
+
+def post_worker_init(worker):
+    # Open pool connections before the worker accepts requests
+    from pools import prewarm, reset_after_fork
+    if preload_app:
+        reset_after_fork(worker.wsgi)
+    prewarm(worker.wsgi)
+
+
+def child_exit(server, worker):
+    # Clean up the exited worker's files in the shared metrics directory
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,84 @@
+"""Password hashing on a bounded process pool
+
+pbkdf2 is deliberately slow, so hashes are computed off the request worker.
+Each worker owns a pool of HASH_POOL_SIZE processes and admits at most
+HASH_QUEUE_DEPTH hashes at once; beyond that callers get PasswordHasherBusy
+rather than queueing behind a login burst. A pool size of 0 hashes inline.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from passlib.context import CryptContext
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool has no room for another request"""
+
+
+def _context(rounds):
+    return CryptContext(schemes=["pbkdf2_sha256"],
+                        pbkdf2_sha256__rounds=rounds)
+
+
+def _hash(password, rounds):
+    return _context(rounds).hash(password)
+
+
+def _verify_and_update(password, password_hash, rounds):
+    return _context(rounds).verify_and_update(password, password_hash)
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config["PASSWORD_HASH_ROUNDS"]
+        self.pool_size = app.config["HASH_POOL_SIZE"]
+        self.timeout = app.config["HASH_TIMEOUT"]
+        self._slots = threading.BoundedSemaphore(
+            app.config["HASH_QUEUE_DEPTH"])
+
+    def _run(self, func, *args):
+        if not self.pool_size:
+            return func(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            # Created on first use so that each forked worker owns its pool
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.pool_size)
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        # Held until the hash is done or cancelled, even past a timeout, so
+        # abandoned hashes still count against HASH_QUEUE_DEPTH
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+
+        except TimeoutError:
+            # Only succeeds while the hash is still queued
+            future.cancel()
+            raise PasswordHasherBusy()
+
+    def hash(self, password):
+        """Returns a pbkdf2_sha256 hash of password"""
+        return self._run(_hash, password, self.rounds)
+
+    def verify_and_update(self, password, password_hash):
+        """Checks password, returning (valid, new hash or None)
+
+        A new hash is returned when password_hash was computed with a
+        different number of rounds than PASSWORD_HASH_ROUNDS.
+        """
+        return self._run(_verify_and_update, password, password_hash,
+                         self.rounds)
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,88 @@
+"""Replays responses to write requests retried with the same Idempotency-Key
+
+The first request carrying a key claims it in redis, and its response is
+stored under the key for IDEMPOTENCY_TTL seconds. Keys belong to the client
+sending them, so clients choosing the same key do not see each other's
+responses. Retries by the same client with the same key, body and Accept
+representation get the stored response back instead of applying the write
+again. A retry arriving while the first request is still running gets a
+409, and a key reused with a different body or representation a 422.
+Errors raised by the view and 5xx responses release the key instead, so the
+request can be retried. If redis is unreachable, requests are processed
+without replay protection.
+"""
+from functools import wraps
+from hashlib import sha1
+
+from flask import current_app, request
+from flask_smorest import abort
+from redis.exceptions import RedisError
+
+from clients import client_id
+from db import redis
+from encoding import negotiated, response_mimetype
+
+# How long a key stays claimed by a request that never completes
+PENDING_TTL = 60
+PENDING = b"pending"
+
+
+def idempotent(func):
+    """Makes a view replay its response for a repeated Idempotency-Key"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return func(*args, **kwargs)
+
+        key = (f"idempotency:{client_id()}:{request.method}:{request.path}"
+               f":{key}")
+        mimetype = response_mimetype()
+        fingerprint = sha1(
+            mimetype.encode() + request.get_data()).hexdigest().encode()
+        try:
+            claimed = redis.set(key, PENDING, nx=True, ex=PENDING_TTL)
+            entry = None if claimed else redis.get(key)
+        except RedisError:
+            current_app.logger.warning("Idempotency keys unavailable")
+            return func(*args, **kwargs)
+
+        if entry == PENDING:
+            abort(409, message="A request with this Idempotency-Key is "
+                  "still being processed.")
+        if entry:
+            status, entry_fingerprint, body = entry.split(b":", 2)
+            if entry_fingerprint != fingerprint:
+                abort(422, message="Idempotency-Key was already used for a "
+                      "different request.")
+            response = current_app.response_class(
+                body, status=int(status), mimetype=mimetype)
+            response.headers["Idempotent-Replayed"] = "true"
+            return negotiated(response)
+
+        try:
+            response = current_app.make_response(func(*args, **kwargs))
+        except Exception:
+            _release(key)
+            raise
+
+        if response.status_code >= 500:
+            _release(key)
+            return response
+
+        try:
+            redis.set(key, b":".join((str(response.status_code).encode(),
+                                      fingerprint, response.get_data())),
+                      ex=current_app.config["IDEMPOTENCY_TTL"])
+        except RedisError:
+            pass
+        return response
+
+    return wrapper
+
+
+def _release(key):
+    try:
+        redis.delete(key)
+    except RedisError:
+        pass
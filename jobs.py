@@ -0,0 +1,334 @@
+"""Background jobs for writes too slow to run inside a request
+
+Expensive endpoints honour `Prefer: respond-async`: rather than doing the
+work, they queue a job, answer 202 with its id and point Location at
+GET /jobs/<id>, which reports its status and result. `flask jobs work` runs
+queued jobs until stopped.
+
+With JOBS_BROKER=redis, queued job ids are kept in a list, jobs waiting to
+be retried in a sorted set by due time and running jobs in a sorted set by
+lease deadline. Workers renew the lease of the job they run every third of
+JOB_TIMEOUT; a job whose lease lapses, because its worker died, is queued
+again, so jobs run at least once.
+JOBS_BROKER=memory keeps jobs in process for tests and development, where
+`queue.work(burst=True)` runs them.
+
+Jobs failing with an unexpected error or a 5xx are retried up to
+JOB_MAX_ATTEMPTS times in all, JOB_BACKOFF seconds later, doubling with
+each attempt up to JOB_MAX_BACKOFF. Jobs aborted with a 4xx fail at once.
+Job records expire JOB_TTL seconds after their last update.
+"""
+import heapq
+import json
+import random
+import signal
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+
+import click
+from flask import current_app, request, url_for
+from flask.cli import AppGroup
+from redis.exceptions import RedisError
+from werkzeug.exceptions import HTTPException
+
+from db import db, redis
+from schema import JobSchema
+
+QUEUE = "jobs:queue"
+DELAYED = "jobs:delayed"
+RUNNING = "jobs:running"
+
+# KEYS[1] queue, KEYS[2] delayed, KEYS[3] running, ARGV[1] lease seconds.
+# Queues due retries and expired leases, then leases the oldest queued job.
+RESERVE = """
+local time = redis.call("TIME")
+local now = time[1] + time[2] / 1000000
+for _, key in ipairs({KEYS[2], KEYS[3]}) do
+    for _, id in ipairs(redis.call("ZRANGEBYSCORE", key, "-inf", now,
+                                   "LIMIT", 0, 100)) do
+        redis.call("ZREM", key, id)
+        redis.call("LPUSH", KEYS[1], id)
+    end
+end
+local id = redis.call("RPOP", KEYS[1])
+if id then
+    redis.call("ZADD", KEYS[3], now + tonumber(ARGV[1]), id)
+end
+return id
+"""
+
+# KEYS[1] running, ARGV[1] job id, ARGV[2] lease seconds. Only extends the
+# lease of a job still running.
+RENEW = """
+local time = redis.call("TIME")
+redis.call("ZADD", KEYS[1], "XX",
+           time[1] + time[2] / 1000000 + tonumber(ARGV[2]), ARGV[1])
+"""
+
+# KEYS[1] running, KEYS[2] delayed, ARGV[1] job id, ARGV[2] delay seconds
+RETRY = """
+local time = redis.call("TIME")
+redis.call("ZREM", KEYS[1], ARGV[1])
+redis.call("ZADD", KEYS[2], time[1] + time[2] / 1000000 + tonumber(ARGV[2]),
+           ARGV[1])
+"""
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def prefers_async():
+    """Returns whether the request sent `Prefer: respond-async`"""
+    return any(preference.split(";")[0].strip().lower() == "respond-async"
+               for preference in request.headers.get("Prefer", "").split(","))
+
+
+class RedisBroker:
+    def __init__(self, lease):
+        self.lease = lease
+        self._reserve = redis.register_script(RESERVE)
+        self._renew = redis.register_script(RENEW)
+        self._retry = redis.register_script(RETRY)
+
+    def save(self, job_id, fields, ttl):
+        pipe = redis.pipeline()
+        pipe.hset(f"job:{job_id}", mapping=fields)
+        pipe.expire(f"job:{job_id}", ttl)
+        pipe.execute()
+
+    def load(self, job_id):
+        return {name.decode(): value.decode()
+                for name, value in redis.hgetall(f"job:{job_id}").items()}
+
+    def add(self, job_id, fields, ttl):
+        # One transaction, so a job is never recorded without being queued
+        pipe = redis.pipeline()
+        pipe.hset(f"job:{job_id}", mapping=fields)
+        pipe.expire(f"job:{job_id}", ttl)
+        pipe.lpush(QUEUE, job_id)
+        pipe.execute()
+
+    def reserve(self):
+        job_id = self._reserve(keys=[QUEUE, DELAYED, RUNNING],
+                               args=[self.lease])
+        return job_id.decode() if job_id else None
+
+    def renew(self, job_id):
+        self._renew(keys=[RUNNING], args=[job_id, self.lease])
+
+    def retry(self, job_id, delay):
+        self._retry(keys=[RUNNING, DELAYED], args=[job_id, delay])
+
+    def done(self, job_id):
+        redis.zrem(RUNNING, job_id)
+
+
+class MemoryBroker:
+    def __init__(self):
+        self.records = {}
+        self.queue = deque()
+        self.delayed = []
+        self._lock = threading.Lock()
+
+    def save(self, job_id, fields, ttl):
+        with self._lock:
+            self.records.setdefault(job_id, {}).update(
+                {name: str(value) for name, value in fields.items()})
+
+    def load(self, job_id):
+        with self._lock:
+            return dict(self.records.get(job_id, {}))
+
+    def add(self, job_id, fields, ttl):
+        self.save(job_id, fields, ttl)
+        with self._lock:
+            self.queue.append(job_id)
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            while self.delayed and self.delayed[0][0] <= now:
+                self.queue.append(heapq.heappop(self.delayed)[1])
+            return self.queue.popleft() if self.queue else None
+
+    def renew(self, job_id):
+        pass
+
+    def retry(self, job_id, delay):
+        with self._lock:
+            heapq.heappush(self.delayed, (time.monotonic() + delay, job_id))
+
+    def done(self, job_id):
+        pass
+
+
+class JobQueue:
+    def __init__(self, app=None):
+        self.tasks = {}
+        self._stopping = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_attempts = app.config["JOB_MAX_ATTEMPTS"]
+        self.backoff = app.config["JOB_BACKOFF"]
+        self.max_backoff = app.config["JOB_MAX_BACKOFF"]
+        self.ttl = app.config["JOB_TTL"]
+        self.poll_interval = app.config["JOB_POLL_INTERVAL"]
+        self.renew_interval = app.config["JOB_TIMEOUT"] / 3
+        self.logger = app.logger
+        if app.config["JOBS_BROKER"] == "memory":
+            self.broker = MemoryBroker()
+        else:
+            self.broker = RedisBroker(app.config["JOB_TIMEOUT"])
+
+    def task(self, name):
+        """Registers a function as the job run for name"""
+        def decorator(func):
+            self.tasks[name] = func
+            return func
+
+        return decorator
+
+    def _save(self, job_id, **fields):
+        self.broker.save(job_id, {**fields, "updated_at": _now()}, self.ttl)
+
+    def enqueue(self, name, **kwargs):
+        """Queues a job calling task name with kwargs, returning its id"""
+        job_id = uuid.uuid4().hex
+        now = _now()
+        self.broker.add(job_id, {
+            "id": job_id, "name": name, "args": json.dumps(kwargs),
+            "status": "queued", "attempts": 0, "created_at": now,
+            "updated_at": now}, self.ttl)
+        return job_id
+
+    def get(self, job_id):
+        """Returns the record of a job, or None if unknown or expired"""
+        record = self.broker.load(job_id)
+        if not record:
+            return None
+        return {**record, "attempts": int(record["attempts"]),
+                "error": record.get("error") or None,
+                "result": json.loads(record.get("result") or "null"),
+                "created_at": datetime.fromisoformat(record["created_at"]),
+                "updated_at": datetime.fromisoformat(record["updated_at"])}
+
+    def respond_async(self, name, **kwargs):
+        """Queues a job if the request prefers an asynchronous response
+
+        Returns a 202 response describing the job, or None when the request
+        should be served synchronously: it did not send respond-async or
+        the job could not be queued.
+        """
+        if not prefers_async():
+            return None
+        try:
+            job_id = self.enqueue(name, **kwargs)
+            job = self.get(job_id)
+        except RedisError as err:
+            self.logger.warning("Serving %s synchronously: %s", name, err)
+            return None
+
+        response = current_app.json.response(JobSchema().dump(job))
+        response.status_code = 202
+        response.headers["Location"] = url_for("Jobs.Job", job_id=job_id)
+        response.headers["Preference-Applied"] = "respond-async"
+        return response
+
+    def _fail(self, job_id, attempts, error, retry=True):
+        if retry and attempts < self.max_attempts:
+            delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            delay *= random.uniform(0.5, 1)
+            self._save(job_id, status="retrying", error=error)
+            self.broker.retry(job_id, delay)
+        else:
+            self._save(job_id, status="failed", error=error)
+            self.broker.done(job_id)
+
+    def _renew(self, job_id, finished):
+        while not finished.wait(self.renew_interval):
+            try:
+                self.broker.renew(job_id)
+            except RedisError as err:
+                self.logger.warning("Could not renew job %s: %s", job_id, err)
+
+    def run(self, job_id):
+        """Runs a reserved job, scheduling a retry if it fails"""
+        record = self.broker.load(job_id)
+        if not record:
+            self.broker.done(job_id)
+            return
+
+        attempts = int(record["attempts"]) + 1
+        task = self.tasks.get(record["name"])
+        if task is None:
+            self._fail(job_id, attempts, f"Unknown job {record['name']}.",
+                       retry=False)
+            return
+
+        self._save(job_id, status="running", attempts=attempts)
+        finished = threading.Event()
+        threading.Thread(target=self._renew, args=(job_id, finished),
+                         daemon=True).start()
+        try:
+            result = task(**json.loads(record["args"]))
+
+        except HTTPException as err:
+            db.session.rollback()
+            message = (getattr(err, "data", None) or {}).get(
+                "message", err.description)
+            self._fail(job_id, attempts, message, retry=err.code >= 500)
+
+        except Exception as err:
+            db.session.rollback()
+            self.logger.exception("Job %s failed", job_id)
+            self._fail(job_id, attempts, str(err))
+
+        else:
+            self._save(job_id, status="succeeded", error="",
+                       result=json.dumps(result))
+            self.broker.done(job_id)
+
+        finally:
+            finished.set()
+            db.session.remove()
+
+    def work(self, burst=False):
+        """Runs jobs until stopped, or until none are queued if burst"""
+        self._stopping = False
+        while not self._stopping:
+            try:
+                job_id = self.broker.reserve()
+                if job_id is not None:
+                    self.run(job_id)
+                    continue
+            except RedisError as err:
+                # Jobs left running are queued again once their lease expires
+                self.logger.warning("Job queue unavailable: %s", err)
+
+            if burst:
+                break
+            time.sleep(self.poll_interval)
+
+    def stop(self, *args):
+        """Stops work() once the current job is done"""
+        self._stopping = True
+
+
+queue = JobQueue()
+
+cli = AppGroup("jobs", help="Run background jobs.")
+
+
+@cli.command("work")
+@click.option("--burst", is_flag=True, help="Exit once no job is queued.")
+def work_command(burst):
+    """Run queued jobs until interrupted."""
+    signal.signal(signal.SIGTERM, queue.stop)
+    signal.signal(signal.SIGINT, queue.stop)
+    queue.work(burst=burst)
@@ -0,0 +1,155 @@
+"""Request admission control: per-client rate limits, per-worker load shedding
+
+Clients are identified by their JWT identity when they send a valid token,
+otherwise by remote address. Each (blueprint, client) pair owns a token
+bucket refilled at RATE_LIMITS' `requests/seconds` for that blueprint,
+kept in redis and updated atomically by a Lua script so every worker shares
+it. If redis is unreachable, buckets are kept in process memory, limiting
+per worker instead of globally.
+
+MAX_IN_FLIGHT_REQUESTS caps the requests a worker serves at once, refusing
+the rest with 503 rather than queueing them behind a slow database. It only
+matters for threaded workers; sync workers serve one request at a time.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, request
+from flask_smorest import abort
+from redis.exceptions import RedisError
+
+from clients import client_id
+from db import redis
+from metrics import REQUESTS_REJECTED
+
+# Buckets kept per worker while redis is unavailable
+FALLBACK_BUCKETS = 10000
+
+# KEYS[1] bucket, ARGV[1] capacity, ARGV[2] seconds to refill it.
+# Returns allowed (0/1), whole tokens left and milliseconds until next token.
+TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = capacity / tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = time[1] + time[2] / 1000000
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(tonumber(ARGV[2]) * 1000))
+return {allowed, math.floor(tokens), math.ceil((1 - tokens) / rate * 1000)}
+"""
+
+
+def parse_limits(value):
+    """Parses "blueprint=requests/seconds,..." into {blueprint: limit}
+
+    Limits are (requests, seconds) pairs, and a limit of 0 leaves a
+    blueprint unlimited. "default" applies to blueprints without their own
+    entry.
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        name, limit = entry.split("=")
+        if limit.strip() == "0":
+            limits[name.strip()] = None
+        else:
+            requests, seconds = limit.split("/")
+            limits[name.strip()] = (int(requests), float(seconds))
+    return limits
+
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.limits = app.config["RATE_LIMITS"]
+        self.logger = app.logger
+        if not app.config["RATE_LIMIT_ENABLED"]:
+            return
+
+        self._script = redis.register_script(TOKEN_BUCKET)
+        app.before_request(self._limit_request)
+
+    def _take_local(self, key, capacity, seconds):
+        rate = capacity / seconds
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > FALLBACK_BUCKETS:
+                self._buckets.popitem(last=False)
+        return allowed, (1 - tokens) / rate
+
+    def take(self, key, capacity, seconds):
+        """Takes a token from a bucket, returning (allowed, seconds to wait)"""
+        try:
+            allowed, _, wait_ms = self._script(keys=[key],
+                                               args=[capacity, seconds])
+            return bool(allowed), wait_ms / 1000
+
+        except RedisError as err:
+            self.logger.warning("Rate limiting per worker: %s", err)
+            return self._take_local(key, capacity, seconds)
+
+    def _limit_request(self):
+        blueprint = request.blueprint or "default"
+        limit = self.limits.get(blueprint, self.limits.get("default"))
+        if limit is None:
+            return
+
+        allowed, wait = self.take(
+            f"ratelimit:{blueprint}:{client_id()}", *limit)
+        if not allowed:
+            REQUESTS_REJECTED.labels(_endpoint(), "rate_limited").inc()
+            abort(429, message="Rate limit exceeded, try again later.",
+                  headers={"Retry-After": str(max(int(wait + 0.999), 1))})
+
+
+class ConcurrencyLimiter:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        limit = app.config["MAX_IN_FLIGHT_REQUESTS"]
+        if not limit:
+            return
+
+        self._slots = threading.BoundedSemaphore(limit)
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+    def _admit(self):
+        if not self._slots.acquire(blocking=False):
+            REQUESTS_REJECTED.labels(_endpoint(), "overloaded").inc()
+            abort(503, message="Server is busy, try again shortly.",
+                  headers={"Retry-After": "1"})
+        g.admitted = True
+
+    def _release(self, error):
+        if g.pop("admitted", False):
+            self._slots.release()
+
+
+limiter = RateLimiter()
+concurrency = ConcurrencyLimiter()
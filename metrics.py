@@ -0,0 +1,136 @@
+"""Per-endpoint latency, SQL, serialization and redis instrumentation
+
+Metrics are exported in Prometheus text format from GET /metrics. Under
+gunicorn, set PROMETHEUS_MULTIPROC_DIR so every worker writes its samples to
+a shared directory and any worker can report the totals.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from prometheus_client import (CollectorRegistry, Counter, Histogram,
+                               REGISTRY, generate_latest, multiprocess)
+from redis import StrictRedis
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency",
+    ["method", "endpoint", "status"])
+DB_STATEMENTS = Counter(
+    "db_statements_total", "SQL statements executed", ["endpoint"])
+DB_SECONDS = Counter(
+    "db_statement_seconds_total", "Time spent executing SQL", ["endpoint"])
+SERIALIZATION_SECONDS = Counter(
+    "serialization_seconds_total", "Time spent dumping schemas", ["endpoint"])
+REDIS_SECONDS = Counter(
+    "redis_command_seconds_total", "Time spent in redis commands",
+    ["endpoint"])
+REQUESTS_REJECTED = Counter(
+    "http_requests_rejected_total", "Requests refused by admission control",
+    ["endpoint", "reason"])
+
+
+def _add(name, value):
+    if has_request_context() and "request_started" in g:
+        setattr(g, name, g.get(name, 0) + value)
+
+
+@contextmanager
+def serialization_timer():
+    """Adds time spent in an outermost schema dump to the current request"""
+    if not has_request_context() or g.get("dumping"):
+        yield
+        return
+
+    g.dumping = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.dumping = False
+        _add("serialization_seconds", time.perf_counter() - started)
+
+
+class InstrumentedRedis(StrictRedis):
+    """Redis client that adds command time to the current request"""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            _add("redis_seconds", time.perf_counter() - started)
+
+
+def _record_statement(context, statement):
+    elapsed = time.perf_counter() - context.query_started
+    _add("db_statements", 1)
+    _add("db_seconds", elapsed)
+    if has_request_context() and "queries" in g:
+        g.queries.append((statement, elapsed))
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    # Kept on the statement's context, which is dropped even if it fails
+    context.query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    _record_statement(context, statement)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # Failed statements, such as ones cancelled by a timeout, take time too
+    context = exception_context.execution_context
+    if context is not None and hasattr(context, "query_started"):
+        _record_statement(context, exception_context.statement)
+
+
+def init_app(app):
+    """Records metrics for every request served by app"""
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        if app.config["SLOW_REQUEST_THRESHOLD"]:
+            g.queries = []
+
+    @app.after_request
+    def record_request(response):
+        if "request_started" not in g:
+            return response
+
+        elapsed = time.perf_counter() - g.request_started
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.labels(request.method, endpoint,
+                               response.status_code).observe(elapsed)
+        DB_STATEMENTS.labels(endpoint).inc(g.get("db_statements", 0))
+        DB_SECONDS.labels(endpoint).inc(g.get("db_seconds", 0))
+        SERIALIZATION_SECONDS.labels(endpoint).inc(
+            g.get("serialization_seconds", 0))
+        REDIS_SECONDS.labels(endpoint).inc(g.get("redis_seconds", 0))
+
+        threshold = app.config["SLOW_REQUEST_THRESHOLD"]
+        if threshold and elapsed >= threshold:
+            app.logger.warning(
+                "Slow request %s %s took %.3fs with %d queries:\n%s",
+                request.method, request.full_path, elapsed, len(g.queries),
+                "\n".join(f"{seconds:.4f}s {statement}"
+                          for statement, seconds in g.queries))
+        return response
+
+
+def exposition():
+    """Returns all metrics in Prometheus text format"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
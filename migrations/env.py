@@ -51,6 +51,12 @@ def get_metadata():
     return target_db.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    # search.py creates the FTS5 search_index table, which keeps its rows in
+    # search_index_* shadow tables, outside the models
+    return not (type_ == "table" and name.startswith("search_index"))
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -68,7 +74,8 @@ def run_migrations_offline():
         url=url,
         target_metadata=get_metadata(),
         compare_type=True,
-        literal_binds=True
+        literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -100,6 +107,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=get_metadata(),
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
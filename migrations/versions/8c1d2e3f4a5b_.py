@@ -0,0 +1,67 @@
+"""indexes and unique constraints for lookup paths
+
+Revision ID: 8c1d2e3f4a5b
+Revises: 57ee853e54af
+Create Date: 2026-10-18 10:12:41.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d2e3f4a5b'
+down_revision = '57ee853e54af'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge tags sharing a store and name into the oldest one, moving their
+    # links over, before enforcing uniqueness
+    op.execute(
+        "UPDATE item_tags SET tag_id = "
+        "(SELECT MIN(kept.id) FROM tags AS kept JOIN tags AS duplicate "
+        "ON kept.store_id = duplicate.store_id AND kept.name = duplicate.name "
+        "WHERE duplicate.id = item_tags.tag_id) "
+        "WHERE tag_id NOT IN "
+        "(SELECT MIN(id) FROM tags GROUP BY store_id, name)"
+    )
+
+    # Drop duplicate links, including those the merge created
+    op.execute(
+        "DELETE FROM item_tags WHERE id NOT IN "
+        "(SELECT MIN(id) FROM item_tags GROUP BY item_id, tag_id)"
+    )
+
+    # Merged tags are left without links
+    op.execute(
+        "DELETE FROM tags WHERE id NOT IN "
+        "(SELECT MIN(id) FROM tags GROUP BY store_id, name)"
+    )
+
+    with op.batch_alter_table('items', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_items_store_id'), ['store_id'],
+                              unique=False)
+
+    with op.batch_alter_table('tags', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_tags_store_id_name',
+                                          ['store_id', 'name'])
+
+    with op.batch_alter_table('item_tags', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_item_tags_tag_id'), ['tag_id'],
+                              unique=False)
+        batch_op.create_unique_constraint('uq_item_tags_item_id_tag_id',
+                                          ['item_id', 'tag_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('item_tags', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_item_tags_item_id_tag_id', type_='unique')
+        batch_op.drop_index(batch_op.f('ix_item_tags_tag_id'))
+
+    with op.batch_alter_table('tags', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_tags_store_id_name', type_='unique')
+
+    with op.batch_alter_table('items', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_items_store_id'))
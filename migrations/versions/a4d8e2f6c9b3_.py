@@ -0,0 +1,36 @@
+"""composite indexes for paginated collections
+
+Revision ID: a4d8e2f6c9b3
+Revises: f1c7a3e9b5d2
+Create Date: 2026-10-18 19:02:41.318447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8e2f6c9b3'
+down_revision = 'f1c7a3e9b5d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_items_store_id_id', 'items', ['store_id', 'id'],
+                    unique=False)
+    op.drop_index('ix_items_store_id', table_name='items')
+    op.create_index('ix_tags_store_id_id', 'tags', ['store_id', 'id'],
+                    unique=False)
+    op.create_index('ix_item_tags_tag_id_item_id', 'item_tags',
+                    ['tag_id', 'item_id'], unique=False)
+    op.drop_index('ix_item_tags_tag_id', table_name='item_tags')
+
+
+def downgrade():
+    op.create_index('ix_item_tags_tag_id', 'item_tags', ['tag_id'],
+                    unique=False)
+    op.drop_index('ix_item_tags_tag_id_item_id', table_name='item_tags')
+    op.drop_index('ix_tags_store_id_id', table_name='tags')
+    op.create_index('ix_items_store_id', 'items', ['store_id'], unique=False)
+    op.drop_index('ix_items_store_id_id', table_name='items')
@@ -0,0 +1,47 @@
+"""per-store aggregates
+
+Revision ID: b7e4c1d9a2f6
+Revises: 8c1d2e3f4a5b
+Create Date: 2026-10-18 11:40:03.117842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4c1d9a2f6'
+down_revision = '8c1d2e3f4a5b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('store_stats',
+    sa.Column('store_id', sa.Integer(), nullable=False),
+    sa.Column('item_count', sa.Integer(), nullable=False),
+    sa.Column('tag_count', sa.Integer(), nullable=False),
+    sa.Column('price_sum', sa.Float(), nullable=False),
+    sa.Column('price_min', sa.Float(precision=2), nullable=True),
+    sa.Column('price_max', sa.Float(precision=2), nullable=True),
+    sa.ForeignKeyConstraint(['store_id'], ['stores.id'], ),
+    sa.PrimaryKeyConstraint('store_id')
+    )
+
+    # Backfill aggregates for existing stores
+    op.execute(
+        "INSERT INTO store_stats "
+        "(store_id, item_count, tag_count, price_sum, price_min, price_max) "
+        "SELECT stores.id, "
+        "(SELECT COUNT(*) FROM items WHERE items.store_id = stores.id), "
+        "(SELECT COUNT(*) FROM tags WHERE tags.store_id = stores.id), "
+        "COALESCE((SELECT SUM(price) FROM items "
+        "WHERE items.store_id = stores.id), 0), "
+        "(SELECT MIN(price) FROM items WHERE items.store_id = stores.id), "
+        "(SELECT MAX(price) FROM items WHERE items.store_id = stores.id) "
+        "FROM stores"
+    )
+
+
+def downgrade():
+    op.drop_table('store_stats')
@@ -0,0 +1,77 @@
+"""name search indexes
+
+Revision ID: d3a9f0b6c21e
+Revises: b7e4c1d9a2f6
+Create Date: 2026-10-18 13:05:22.640311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a9f0b6c21e'
+down_revision = 'b7e4c1d9a2f6'
+branch_labels = None
+depends_on = None
+
+# FTS5 table and sync triggers, mirroring search.SQLITE_DDL
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index "
+    "USING fts5(name, tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS items_search_insert AFTER INSERT ON items "
+    "BEGIN INSERT INTO search_index(rowid, name) "
+    "VALUES (new.id * 2, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS items_search_update "
+    "AFTER UPDATE OF name ON items "
+    "BEGIN UPDATE search_index SET name = new.name "
+    "WHERE rowid = new.id * 2; END",
+    "CREATE TRIGGER IF NOT EXISTS items_search_delete AFTER DELETE ON items "
+    "BEGIN DELETE FROM search_index WHERE rowid = old.id * 2; END",
+    "CREATE TRIGGER IF NOT EXISTS tags_search_insert AFTER INSERT ON tags "
+    "BEGIN INSERT INTO search_index(rowid, name) "
+    "VALUES (new.id * 2 + 1, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS tags_search_update "
+    "AFTER UPDATE OF name ON tags "
+    "BEGIN UPDATE search_index SET name = new.name "
+    "WHERE rowid = new.id * 2 + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS tags_search_delete AFTER DELETE ON tags "
+    "BEGIN DELETE FROM search_index WHERE rowid = old.id * 2 + 1; END",
+]
+
+SQLITE_TRIGGERS = ['items_search_insert', 'items_search_update',
+                   'items_search_delete', 'tags_search_insert',
+                   'tags_search_update', 'tags_search_delete']
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+        op.execute(
+            "INSERT INTO search_index(rowid, name) "
+            "SELECT id * 2, name FROM items "
+            "UNION ALL SELECT id * 2 + 1, name FROM tags"
+        )
+
+    elif dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.create_index('ix_items_name_trgm', 'items', ['name'], unique=False,
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_tags_name_trgm', 'tags', ['name'], unique=False,
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in SQLITE_TRIGGERS:
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS search_index")
+
+    elif dialect == 'postgresql':
+        op.drop_index('ix_tags_name_trgm', table_name='tags')
+        op.drop_index('ix_items_name_trgm', table_name='items')
@@ -0,0 +1,44 @@
+"""item versions for conditional updates
+
+Revision ID: e5b2c8d4f7a1
+Revises: d3a9f0b6c21e
+Create Date: 2026-10-18 15:22:47.305918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b2c8d4f7a1'
+down_revision = 'd3a9f0b6c21e'
+branch_labels = None
+depends_on = None
+
+# Search triggers of d3a9f0b6c21e, lost when SQLite rebuilds the table
+SQLITE_ITEM_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS items_search_insert AFTER INSERT ON items "
+    "BEGIN INSERT INTO search_index(rowid, name) "
+    "VALUES (new.id * 2, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS items_search_update "
+    "AFTER UPDATE OF name ON items "
+    "BEGIN UPDATE search_index SET name = new.name "
+    "WHERE rowid = new.id * 2; END",
+    "CREATE TRIGGER IF NOT EXISTS items_search_delete AFTER DELETE ON items "
+    "BEGIN DELETE FROM search_index WHERE rowid = old.id * 2; END",
+]
+
+
+def upgrade():
+    with op.batch_alter_table('items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(),
+                                      nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('items', schema=None) as batch_op:
+        batch_op.drop_column('version')
+
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_ITEM_TRIGGERS:
+            op.execute(statement)
@@ -0,0 +1,28 @@
+"""change event outbox
+
+Revision ID: f1c7a3e9b5d2
+Revises: e5b2c8d4f7a1
+Create Date: 2026-10-18 16:48:09.552170
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c7a3e9b5d2'
+down_revision = 'e5b2c8d4f7a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('change_outbox')
@@ -1,5 +1,7 @@
 from models.store import StoreModel
+from models.store_stats import StoreStatsModel
 from models.item import ItemModel
 from models.tag import TagModel
 from models.item_tags import ItemTags
-from models.user import UserModel
\ No newline at end of file
+from models.user import UserModel
+from models.change_outbox import ChangeOutboxModel
\ No newline at end of file
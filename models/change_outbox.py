@@ -0,0 +1,10 @@
+"""Defines Model for change events waiting to be published"""
+from db import db
+
+
+class ChangeOutboxModel(db.Model):
+    __tablename__ = "change_outbox"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # JSON encoded stream fields of the event
+    event = db.Column(db.Text, nullable=False)
@@ -3,11 +3,18 @@ from db import db
 
 class ItemModel(db.Model):
     __tablename__ = "items"
+    __table_args__ = (
+        # Serves pages of a store's items by id
+        db.Index("ix_items_store_id_id", "store_id", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     price = db.Column(db.Float(precision=2), unique=False, nullable=False)
     name = db.Column(db.String(80), unique=True, nullable=False)
-    store_id = db.Column(db.Integer, db.ForeignKey("stores.id"), unique=False, nullable=False)
+    store_id = db.Column(db.Integer, db.ForeignKey("stores.id"), unique=False,
+                         nullable=False)
+    # Incremented by every PUT and tag change, checked against If-Match
+    version = db.Column(db.Integer, nullable=False, default=1)
 
     store = db.relationship("StoreModel", back_populates="items")
     tags = db.relationship("TagModel", back_populates="items",
@@ -3,6 +3,12 @@ from db import db
 
 class ItemTags(db.Model):
     __tablename__ = "item_tags"
+    __table_args__ = (
+        db.UniqueConstraint("item_id", "tag_id",
+                            name="uq_item_tags_item_id_tag_id"),
+        # Serves pages of a tag's items by id
+        db.Index("ix_item_tags_tag_id_item_id", "tag_id", "item_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     item_id = db.Column(db.Integer, db.ForeignKey("items.id"))
@@ -6,5 +6,7 @@ class StoreModel(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
-    items = db.relationship("ItemModel", back_populates="store", lazy="dynamic")
-    tags = db.relationship("TagModel", back_populates="store", lazy="dynamic")
\ No newline at end of file
+    items = db.relationship("ItemModel", back_populates="store")
+    tags = db.relationship("TagModel", back_populates="store")
+    stats = db.relationship("StoreStatsModel", back_populates="store",
+                            uselist=False, cascade="all, delete-orphan")
\ No newline at end of file
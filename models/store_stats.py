@@ -0,0 +1,20 @@
+"""Defines Model for per-store aggregates"""
+from db import db
+
+
+class StoreStatsModel(db.Model):
+    __tablename__ = "store_stats"
+
+    store_id = db.Column(db.Integer, db.ForeignKey("stores.id"),
+                         primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    tag_count = db.Column(db.Integer, nullable=False, default=0)
+    price_sum = db.Column(db.Float, nullable=False, default=0)
+    price_min = db.Column(db.Float(precision=2), nullable=True)
+    price_max = db.Column(db.Float(precision=2), nullable=True)
+
+    store = db.relationship("StoreModel", back_populates="stats")
+
+    @property
+    def price_avg(self):
+        return self.price_sum / self.item_count if self.item_count else None
@@ -3,6 +3,11 @@ from db import db
 
 class TagModel(db.Model):
     __tablename__ = "tags"
+    __table_args__ = (
+        db.UniqueConstraint("store_id", "name", name="uq_tags_store_id_name"),
+        # Serves pages of a store's tags by id
+        db.Index("ix_tags_store_id_id", "store_id", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=False, nullable=False)
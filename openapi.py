@@ -0,0 +1,54 @@
+"""flask-smorest Api generating the OpenAPI document on first use
+
+Documenting a blueprint walks and deep-copies every view's schemas, which is
+a large part of create_app(). Workers rarely serve the document, so
+blueprints are only routed at registration and documented the first time
+the spec is read, by /openapi.json, the Swagger UI or `flask openapi`. The
+rendered JSON is cached for the life of the process.
+"""
+import json
+import threading
+
+from flask import current_app
+from flask_smorest import Api
+
+
+class LazyApi(Api):
+    def __init__(self, app=None, **kwargs):
+        self._spec = None
+        self._spec_json = None
+        self._pending = []
+        self._lock = threading.Lock()
+        super().__init__(app, **kwargs)
+
+    @property
+    def spec(self):
+        if self._pending:
+            self._document_pending()
+        return self._spec
+
+    @spec.setter
+    def spec(self, spec):
+        self._spec = spec
+
+    def register_blueprint(self, blp, *, parameters=None, **options):
+        """Registers a blueprint, deferring its documentation"""
+        self._app.register_blueprint(blp, **options)
+        self._pending.append((blp, options.get("name", blp.name), parameters))
+        self._spec_json = None
+
+    def _document_pending(self):
+        with self._lock:
+            # Popped once documented, so readers never see a partial spec
+            while self._pending:
+                blp, name, parameters = self._pending[0]
+                blp.register_views_in_doc(self, self._app, self._spec,
+                                          name=name, parameters=parameters)
+                self._spec.tag({"name": name, "description": blp.description})
+                self._pending.pop(0)
+
+    def _openapi_json(self):
+        if self._spec_json is None:
+            self._spec_json = json.dumps(self.spec.to_dict(), indent=2)
+        return current_app.response_class(self._spec_json,
+                                           mimetype="application/json")
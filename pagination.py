@@ -0,0 +1,36 @@
+"""Keyset pagination of listings ordered by id
+
+A page holds up to `limit` rows (ITEMS_PAGE_SIZE by default, at most
+ITEMS_MAX_PAGE_SIZE) with ids above `after`. A full page links to the next
+with a Link header, keeping the other query parameters.
+"""
+from flask import current_app, request, url_for
+
+from db import db
+
+
+def page_size(args):
+    """Returns the number of rows per page requested in args"""
+    return min(args.get("limit", current_app.config["ITEMS_PAGE_SIZE"]),
+               current_app.config["ITEMS_MAX_PAGE_SIZE"])
+
+
+def next_link(rows, limit, endpoint, **values):
+    """Returns headers linking to the page after rows, if they fill one"""
+    if len(rows) < limit:
+        return {}
+    next_args = {**request.args.to_dict(), **values, "after": rows[-1].id,
+                 "limit": limit}
+    return {"Link": f'<{url_for(endpoint, **next_args)}>; rel="next"'}
+
+
+def paginate(query, key, args, endpoint, **values):
+    """Returns a page of the objects of query by key, and its headers
+
+    key must be, or equal, the id of the objects selected.
+    """
+    limit = page_size(args)
+    if "after" in args:
+        query = query.where(key > args["after"])
+    rows = db.session.scalars(query.order_by(key).limit(limit)).all()
+    return rows, next_link(rows, limit, endpoint, **values)
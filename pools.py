@@ -0,0 +1,134 @@
+"""Configuration, pre-warming and statistics for the database and redis pools
+
+Statistics are kept per worker process, so each gunicorn worker reports its
+own pools; multiply by the number of workers when sizing against Postgres
+`max_connections`.
+"""
+import os
+import time
+
+from redis.exceptions import RedisError
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError
+from sqlalchemy.pool import QueuePool
+
+from db import db, redis
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection"""
+
+    checkouts = 0
+    timeouts = 0
+    wait_total = 0.0
+    wait_max = 0.0
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+
+        except TimeoutError:
+            InstrumentedQueuePool.timeouts += 1
+            raise
+
+        finally:
+            waited = time.perf_counter() - started
+            InstrumentedQueuePool.checkouts += 1
+            InstrumentedQueuePool.wait_total += waited
+            InstrumentedQueuePool.wait_max = max(
+                InstrumentedQueuePool.wait_max, waited)
+
+
+def engine_options(config):
+    """Returns SQLALCHEMY_ENGINE_OPTIONS for the configured database"""
+    options = {
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+    }
+
+    # SQLite connections are local files, there is no server pool to size
+    if config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        return options
+
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=config["DB_POOL_SIZE"],
+        max_overflow=config["DB_MAX_OVERFLOW"],
+        pool_timeout=config["DB_POOL_TIMEOUT"],
+    )
+    if config["DB_STATEMENT_TIMEOUT"] and \
+            config["SQLALCHEMY_DATABASE_URI"].startswith("postgres"):
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"
+        }
+    return options
+
+
+def redis_options(config):
+    """Returns connection pool keyword arguments for FlaskRedis"""
+    return {
+        "max_connections": config["REDIS_MAX_CONNECTIONS"],
+        "socket_timeout": config["REDIS_SOCKET_TIMEOUT"],
+        "socket_connect_timeout": config["REDIS_SOCKET_TIMEOUT"],
+        "health_check_interval": config["REDIS_HEALTH_CHECK_INTERVAL"],
+    }
+
+
+def reset_after_fork(app):
+    """Drops pool connections a worker inherited from a preloading master
+
+    The master's sockets are left open for the master, each worker then
+    opens its own connections on first use.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    redis.connection_pool.reset()
+
+
+def prewarm(app):
+    """Opens POOL_PREWARM database and redis connections ahead of traffic"""
+    count = app.config["POOL_PREWARM"]
+    with app.app_context():
+        try:
+            connections = [db.engine.connect() for _ in range(count)]
+            for connection in connections:
+                connection.close()
+
+        except SQLAlchemyError as err:
+            app.logger.warning("Could not pre-warm database pool: %s", err)
+
+        pool = redis.connection_pool
+        try:
+            connections = [pool.get_connection("PING") for _ in range(count)]
+            for connection in connections:
+                pool.release(connection)
+
+        except RedisError as err:
+            app.logger.warning("Could not pre-warm redis pool: %s", err)
+
+
+def pool_stats():
+    """Returns usage of this worker's database and redis pools"""
+    pool = db.engine.pool
+    database = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        database.update(size=pool.size(), checked_in=pool.checkedin(),
+                        checked_out=pool.checkedout(),
+                        overflow=pool.overflow())
+    if isinstance(pool, InstrumentedQueuePool):
+        database.update(checkouts=pool.checkouts, timeouts=pool.timeouts,
+                        wait_seconds_total=pool.wait_total,
+                        wait_seconds_max=pool.wait_max)
+
+    redis_pool = redis.connection_pool
+    return {
+        "pid": os.getpid(),
+        "database": database,
+        "redis": {
+            "max_connections": redis_pool.max_connections,
+            "created": redis_pool._created_connections,
+            "available": len(redis_pool._available_connections),
+            "in_use": len(redis_pool._in_use_connections),
+        },
+    }
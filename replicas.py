@@ -0,0 +1,129 @@
+"""Routes read-only requests to database read replicas
+
+Replicas are configured as DATABASE_REPLICA_URLS and registered as
+SQLAlchemy binds. GET and HEAD requests read from the next healthy replica in
+round-robin order, unless the client wrote within the last
+REPLICA_PIN_SECONDS, in which case it keeps reading from the primary so it
+sees its own writes, bypassing the response cache, which may hold what a
+replica returned. Clients are identified as in clients.py, so users
+sharing an address are pinned separately. Replicas failing a health check or
+lagging more than REPLICA_MAX_LAG seconds are skipped until their next check.
+"""
+import time
+from itertools import cycle
+
+from flask import g, request
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+
+from clients import client_id
+from db import db, redis
+
+READ_METHODS = {"GET", "HEAD"}
+
+
+def replica_binds(config, engine_options):
+    """Returns SQLALCHEMY_BINDS entries for the configured replicas"""
+    return {f"replica_{number}": {"url": url, **engine_options}
+            for number, url in enumerate(config["DATABASE_REPLICA_URLS"])}
+
+
+class ReplicaRouter:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.keys = [f"replica_{number}" for number
+                     in range(len(app.config["DATABASE_REPLICA_URLS"]))]
+        self.pin_seconds = app.config["REPLICA_PIN_SECONDS"]
+        self.check_interval = app.config["REPLICA_CHECK_INTERVAL"]
+        self.max_lag = app.config["REPLICA_MAX_LAG"]
+        self.logger = app.logger
+        self._order = cycle(self.keys)
+        self._health = {}
+        if not self.keys:
+            return
+
+        app.before_request(self._route_request)
+        app.after_request(self._pin_writer)
+        app.teardown_request(self._check_failure)
+
+    def _pin_key(self):
+        return f"replica-pin:{client_id()}"
+
+    def _pinned(self):
+        try:
+            return bool(redis.exists(self._pin_key()))
+        except RedisError:
+            # Cannot tell if the client just wrote, so read what it wrote
+            return True
+
+    def _healthy(self, key):
+        checked, healthy = self._health.get(key, (0, False))
+        if time.monotonic() - checked < self.check_interval:
+            return healthy
+
+        try:
+            with db.engines[key].connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    lag = connection.execute(text(
+                        "SELECT COALESCE(EXTRACT(EPOCH FROM now() - "
+                        "pg_last_xact_replay_timestamp()), 0)")).scalar()
+                else:
+                    connection.execute(text("SELECT 1"))
+                    lag = 0
+            healthy = lag <= self.max_lag
+            if not healthy:
+                self.logger.warning("Replica %s is %.1fs behind", key, lag)
+
+        except SQLAlchemyError as err:
+            self.logger.warning("Replica %s is unavailable: %s", key, err)
+            healthy = False
+
+        self._health[key] = (time.monotonic(), healthy)
+        return healthy
+
+    def choose(self):
+        """Returns the engine of the next healthy replica, or None"""
+        for _ in self.keys:
+            key = next(self._order)
+            if self._healthy(key):
+                return key, db.engines[key]
+        return None
+
+    def _route_request(self):
+        if request.method not in READ_METHODS:
+            return
+        if self._pinned():
+            g.pinned_to_primary = True
+            return
+        replica = self.choose()
+        if replica is not None:
+            g.replica_key, g.read_bind = replica
+
+    def _pin_writer(self, response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            try:
+                redis.set(self._pin_key(), 1, ex=self.pin_seconds)
+            except RedisError:
+                pass
+        return response
+
+    def _check_failure(self, error):
+        if isinstance(error, DBAPIError) and "replica_key" in g:
+            self._health[g.replica_key] = (time.monotonic(), False)
+
+
+def served_from_replica():
+    """Returns True if the current request reads from a replica"""
+    return "read_bind" in g
+
+
+def pinned_to_primary():
+    """Returns True if the current request must see the client's writes"""
+    return "pinned_to_primary" in g
+
+
+router = ReplicaRouter()
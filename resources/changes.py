@@ -0,0 +1,48 @@
+"""Defines endpoint for syncing catalog changes incrementally"""
+from flask import current_app, request, url_for
+from flask.views import MethodView
+from flask_smorest import Blueprint, abort
+from redis.exceptions import RedisError
+
+import fieldsets
+from changes import feed
+from schema import ChangeArgsSchema, ChangeSchema
+
+bp = Blueprint("Changes", "changes", description="Operations on changes")
+
+
+@bp.route("/changes")
+class Changes(MethodView):
+    @bp.arguments(ChangeArgsSchema, location="query")
+    @bp.response(200, ChangeSchema(many=True))
+    @bp.alt_response(410, description="Changes after the cursor were "
+                     "discarded, re-read the catalog and sync from the "
+                     "latest cursor.")
+    def get(self, args):
+        """Returns changes to items, stores, tags and links after a cursor
+
+        Pass the cursor of the last change received as `since` to continue;
+        omit it to read from the oldest change kept. A store delete also
+        deletes the store's items, tags and their links, without changes of
+        their own.
+        """
+        limit = min(args.get("limit", current_app.config["ITEMS_PAGE_SIZE"]),
+                    current_app.config["ITEMS_MAX_PAGE_SIZE"])
+        try:
+            changes = feed.read(args["since"], limit)
+        except RedisError:
+            abort(503, message="Change feed is unavailable.")
+
+        if changes is None:
+            abort(410, message="Changes after this cursor are no longer "
+                  "available.")
+
+        headers = {}
+        if len(changes) == limit:
+            next_args = {**request.args.to_dict(),
+                         "since": changes[-1]["cursor"], "limit": limit}
+            next_url = url_for("Changes.Changes", **next_args)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+
+        return fieldsets.Sparse(
+            changes, fieldsets.resolve(ChangeSchema, args)), headers
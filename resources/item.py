@@ -1,24 +1,336 @@
 """Defines endpoints and for fetching, updating, and deleting items"""
-from flask import request
+import csv
+import io
+import json
+from hashlib import sha1
+from itertools import islice
+
+from flask import Response, current_app, request, stream_with_context
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
-from sqlalchemy.exc import SQLAlchemyError
+from marshmallow import ValidationError
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import joinedload, selectinload, undefer
 
-from db import db
-from models import ItemModel
-from schema import ItemSchema, ItemUpdateSchema
+import cache
+import fieldsets
+import pagination
+import stats
+from changes import feed
+from db import UPSERT_DIALECTS, db
+from encoding import response_mimetype
+from idempotency import idempotent
+from models import ItemModel, ItemTags, StoreModel, TagModel
+from schema import (ItemSchema, ItemUpdateSchema, ItemQueryArgsSchema,
+                    ItemImportSchema, ItemImportResultSchema,
+                    FieldsetArgsSchema, PageArgsSchema)
 
 # Initialize module as blueprint
 bp = Blueprint("items", __name__, description="Operations on items")
 
+# Relationships dumped by ItemSchema, loaded in batches rather than per row
+ITEM_LOAD_OPTIONS = (joinedload(ItemModel.store), selectinload(ItemModel.tags))
+
+# Times PUT retries an update that lost a race with a concurrent one
+PUT_ATTEMPTS = 3
+
+
+def item_versions(item):
+    """Returns cached entities whose responses embed the item"""
+    return (cache.CATALOG, ("item", item.id), ("store", item.store_id),
+            *(("tag", tag.id) for tag in item.tags),
+            *(("store", tag.store_id) for tag in item.tags))
+
+
+def bump_versions(item_ids):
+    """Bumps the versions of items whose tags changed"""
+    items = ItemModel.__table__
+    if item_ids:
+        db.session.execute(update(items).where(items.c.id.in_(item_ids))
+                           .values(version=items.c.version + 1))
+
+
+def item_etag(version, only):
+    """Returns the ETag of an item's representation
+
+    It is the item's version, then a hash of the fieldset and format
+    negotiated, so each representation of a version is tagged apart.
+    """
+    fieldset = "*" if only is None else ",".join(sorted(only))
+    representation = sha1(
+        f"{response_mimetype()};{fieldset}".encode()).hexdigest()[:8]
+    return f'"{version}-{representation}"'
+
+
+def if_match_versions(if_match):
+    """Returns the item versions of the ETags listed in If-Match"""
+    # Compressed GET responses weaken the ETag
+    versions = (tag.partition("-")[0]
+                for tag in if_match.as_set(include_weak=True))
+    return {int(version) for version in versions if version.isdigit()}
+
+
+def update_item(item_id, fields, versions=None):
+    """Applies fields to an item, bumping its version
+
+    Returns (store_id, price, old store_id, old price), or None if the item
+    does not exist, its version is not in versions or it changed
+    concurrently. Postgres does this in one UPDATE reporting the old values;
+    elsewhere the old values are read first.
+    """
+    items = ItemModel.__table__
+    values = {**fields, "version": items.c.version + 1}
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        old = select(items.c.id, items.c.store_id, items.c.price,
+                     items.c.version).where(items.c.id == item_id).subquery()
+        statement = update(items).where(
+            items.c.id == old.c.id, items.c.version == old.c.version)
+        if versions is not None:
+            statement = statement.where(items.c.version.in_(versions))
+        return db.session.execute(statement.values(values).returning(
+            items.c.store_id, items.c.price, old.c.store_id,
+            old.c.price)).first()
+
+    old = db.session.execute(select(
+        items.c.store_id, items.c.price, items.c.version).where(
+            items.c.id == item_id).with_for_update()).first()
+    if old is None or (versions is not None and old.version not in versions):
+        return None
+
+    # The version check makes the write fail if the item changed since read
+    updated = db.session.execute(update(items).where(
+        items.c.id == item_id, items.c.version == old.version).values(
+            values)).rowcount
+    if not updated:
+        return None
+    return (fields.get("store_id", old.store_id),
+            fields.get("price", old.price), old.store_id, old.price)
+
+
+def insert_item(item_id, fields):
+    """Creates an item with a given id
+
+    Returns (store_id, price, None, None), or None if fields lack a name,
+    price or store_id or the item was created concurrently.
+    """
+    if not {"name", "price", "store_id"} <= fields.keys():
+        return None
+
+    items = ItemModel.__table__
+    dialect = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect is None:
+        db.session.execute(insert(items).values(id=item_id, **fields))
+        return fields["store_id"], fields["price"], None, None
+
+    created = db.session.execute(
+        dialect.insert(items).values(id=item_id, **fields)
+        .on_conflict_do_nothing(index_elements=[items.c.id])
+        .returning(items.c.store_id, items.c.price)).first()
+    return created and (*created, None, None)
+
+
+def filter_items(query, args):
+    """Applies the store, price and tag filters of a GET /item request"""
+    if "store_id" in args:
+        query = query.where(ItemModel.store_id == args["store_id"])
+    if "min_price" in args:
+        query = query.where(ItemModel.price >= args["min_price"])
+    if "max_price" in args:
+        query = query.where(ItemModel.price <= args["max_price"])
+    if "tag_id" in args:
+        query = query.where(ItemModel.id.in_(
+            select(ItemTags.item_id).where(ItemTags.tag_id == args["tag_id"])))
+    if "after" in args:
+        query = query.where(ItemModel.id > args["after"])
+    return query
+
+
+def dump_items(query, only=None):
+    """Yields each item of query as JSON, fetched from a server-side cursor"""
+    schema = ItemSchema(only=only)
+    query = query.options(*fieldsets.load_options(
+        ItemModel, only, ITEM_LOAD_OPTIONS)).execution_options(
+        yield_per=current_app.config["ITEMS_STREAM_BATCH_SIZE"])
+    for item in db.session.scalars(query):
+        yield current_app.json.dumps(schema.dump(item))
+
+
+def stream_items(query, only=None):
+    """Emits a JSON array of items row by row"""
+    def generate():
+        yield "["
+        for index, item in enumerate(dump_items(query, only)):
+            yield ("," if index else "") + item
+        yield "]"
+
+    return Response(stream_with_context(generate()),
+                    mimetype="application/json")
+
+
+def read_import_rows():
+    """Yields raw item rows from an NDJSON or CSV request body"""
+    if request.mimetype == "text/csv":
+        reader = csv.DictReader(io.TextIOWrapper(request.stream,
+                                                 encoding="utf-8"))
+        for row in reader:
+            tag_ids = row.pop("tag_ids", None) or ""
+            row["tag_ids"] = [tag_id for tag_id in tag_ids.split(";")
+                              if tag_id]
+            yield row
+
+    elif request.mimetype == "application/x-ndjson":
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Fails validation as an invalid input type
+                yield None
+
+    else:
+        abort(415, message="Send items as application/x-ndjson or text/csv.")
+
+
+def import_chunk(chunk, schema):
+    """Validates and inserts a chunk of (row number, row) in one transaction"""
+    errors = []
+    valid = []
+    for row_number, row in chunk:
+        try:
+            valid.append((row_number, schema.load(row)))
+        except ValidationError as err:
+            errors.append({"row": row_number, "errors": err.messages})
+
+    names = db.session.scalars(select(ItemModel.name).where(
+        ItemModel.name.in_({data["name"] for _, data in valid})))
+    store_ids = db.session.scalars(select(StoreModel.id).where(
+        StoreModel.id.in_({data["store_id"] for _, data in valid})))
+    tag_stores = dict(db.session.execute(
+        select(TagModel.id, TagModel.store_id).where(TagModel.id.in_(
+            {tag_id for _, data in valid
+             for tag_id in data["tag_ids"]}))).all())
+    names, store_ids = set(names), set(store_ids)
+
+    rows = []
+    for row_number, data in valid:
+        missing_tags = set(data["tag_ids"]) - tag_stores.keys()
+        if data["name"] in names:
+            error = {"name": ["Item with that name already exists."]}
+        elif data["store_id"] not in store_ids:
+            error = {"store_id": ["Store not found."]}
+        elif missing_tags:
+            error = {"tag_ids": [f"Tags not found: {sorted(missing_tags)}"]}
+        else:
+            names.add(data["name"])
+            rows.append((row_number, data))
+            continue
+        errors.append({"row": row_number, "errors": error})
+
+    if not rows:
+        return 0, errors
+
+    try:
+        db.session.execute(insert(ItemModel), [
+            {"name": data["name"], "price": data["price"],
+             "store_id": data["store_id"]} for _, data in rows])
+        item_ids = dict(db.session.execute(
+            select(ItemModel.name, ItemModel.id).where(
+                ItemModel.name.in_([data["name"] for _, data in rows]))).all())
+        links = [{"item_id": item_ids[data["name"]], "tag_id": tag_id}
+                 for _, data in rows for tag_id in set(data["tag_ids"])]
+        if links:
+            db.session.execute(insert(ItemTags), links)
+        for _, data in rows:
+            feed.record("item", "create", item_ids[data["name"]],
+                        store_id=data["store_id"])
+        for link in links:
+            feed.record("link", "create", **link)
+
+        prices = {}
+        for _, data in rows:
+            prices.setdefault(data["store_id"], []).append(data["price"])
+        for store_id, store_prices in prices.items():
+            stats.items_added(store_id, len(store_prices), sum(store_prices),
+                              min(store_prices), max(store_prices))
+        db.session.commit()
+
+    except SQLAlchemyError:
+        db.session.rollback()
+        errors.extend({"row": row_number,
+                       "errors": {"_schema": ["Could not insert chunk."]}}
+                      for row_number, _ in rows)
+        return 0, errors
+
+    tag_ids = {tag_id for _, data in rows for tag_id in data["tag_ids"]}
+    cache.invalidate(cache.CATALOG,
+                     *(("store", data["store_id"]) for _, data in rows),
+                     *(("tag", tag_id) for tag_id in tag_ids),
+                     *(("store", tag_stores[tag_id]) for tag_id in tag_ids))
+    return len(rows), errors
+
+
+@bp.route("/item/bulk")
+class ItemBulk(MethodView):
+    @bp.response(200, ItemImportResultSchema)
+    def post(self):
+        """Imports items from an NDJSON or CSV stream
+
+        Rows are validated and inserted in chunks of BULK_CHUNK_SIZE, each in
+        its own transaction. Tags are linked through a `tag_ids` list (`;`
+        separated in CSV). Rows that fail are reported by row number.
+        """
+        schema = ItemImportSchema()
+        rows = enumerate(read_import_rows(), 1)
+        created, errors = 0, []
+        chunk_size = current_app.config["BULK_CHUNK_SIZE"]
+        while chunk := list(islice(rows, chunk_size)):
+            chunk_created, chunk_errors = import_chunk(chunk, schema)
+            created += chunk_created
+            errors.extend(chunk_errors)
+
+        return {"created": created, "errors": errors}
+
+
+@bp.route("/item/export")
+class ItemExport(MethodView):
+    @bp.arguments(ItemQueryArgsSchema, location="query")
+    @bp.response(200, ItemSchema(many=True),
+                 content_type="application/x-ndjson")
+    def get(self, args):
+        """Exports items with their store and tags as NDJSON"""
+        query = filter_items(select(ItemModel), args).order_by(ItemModel.id)
+        only = fieldsets.resolve(ItemSchema, args)
+
+        def generate():
+            for item in dump_items(query, only):
+                yield item + "\n"
+
+        return Response(stream_with_context(generate()),
+                        mimetype="application/x-ndjson")
+
 
 @bp.route("/item")
 class ItemList(MethodView):
+    @bp.arguments(ItemQueryArgsSchema, location="query")
     @bp.response(200, ItemSchema(many=True))
-    def get(self):
-        """Returns all items in stores"""
-        items = ItemModel.query.all()
-        return items
+    def get(self, args):
+        """Returns items in stores, paginated by id"""
+        query = filter_items(select(ItemModel), args).order_by(ItemModel.id)
+        only = fieldsets.resolve(ItemSchema, args)
+
+        if args["stream"]:
+            if "limit" in args:
+                query = query.limit(args["limit"])
+            return stream_items(query, only)
+
+        limit = pagination.page_size(args)
+        items = db.session.scalars(query.options(*fieldsets.load_options(
+            ItemModel, only, ITEM_LOAD_OPTIONS)).limit(limit)).all()
+        return (fieldsets.Sparse(items, only),
+                pagination.next_link(items, limit, "items.ItemList"))
 
     @bp.arguments(ItemSchema)
     @bp.response(201, ItemSchema)
@@ -27,43 +339,139 @@ class ItemList(MethodView):
         item = ItemModel(**item_data)
         try:
             db.session.add(item)
+            stats.item_added(item.store_id, item.price)
+            db.session.flush()
+            feed.record("item", "create", item.id, store_id=item.store_id)
             db.session.commit()
 
         except SQLAlchemyError:
             abort(500, message="An error occured while creating item.")
 
+        cache.invalidate(cache.CATALOG, ("store", item.store_id))
         return item
 
 
+@bp.route("/store/<int:store_id>/item")
+class ItemInStore(MethodView):
+    @cache.cached("store", "store_id")
+    @bp.arguments(PageArgsSchema, location="query")
+    @bp.response(200, ItemSchema(many=True))
+    def get(self, args, store_id):
+        """Returns the items of a store, paginated by id"""
+        db.get_or_404(StoreModel, store_id)
+        only = fieldsets.resolve(ItemSchema, args)
+        items, headers = pagination.paginate(
+            select(ItemModel).options(*fieldsets.load_options(
+                ItemModel, only, ITEM_LOAD_OPTIONS)).where(
+                    ItemModel.store_id == store_id),
+            ItemModel.id, args, "items.ItemInStore", store_id=store_id)
+        return fieldsets.Sparse(items, only), headers
+
+
+@bp.route("/tag/<int:tag_id>/item")
+class ItemInTag(MethodView):
+    @cache.cached("tag", "tag_id")
+    @bp.arguments(PageArgsSchema, location="query")
+    @bp.response(200, ItemSchema(many=True))
+    def get(self, args, tag_id):
+        """Returns the items tagged with a tag, paginated by id"""
+        db.get_or_404(TagModel, tag_id)
+        only = fieldsets.resolve(ItemSchema, args)
+        # Ordered by the link so the (tag_id, item_id) index serves the page
+        items, headers = pagination.paginate(
+            select(ItemModel).join(ItemTags, ItemTags.item_id == ItemModel.id)
+            .options(*fieldsets.load_options(
+                ItemModel, only, ITEM_LOAD_OPTIONS)).where(
+                    ItemTags.tag_id == tag_id),
+            ItemTags.item_id, args, "items.ItemInTag", tag_id=tag_id)
+        return fieldsets.Sparse(items, only), headers
+
+
 @bp.route("/item/<int:item_id>")
 class Item(MethodView):
+    @cache.cached("item", "item_id")
+    @bp.arguments(FieldsetArgsSchema, location="query")
     @bp.response(200, ItemSchema)
-    def get(self, item_id):
-        """Get an item"""
-        item = ItemModel.query.get_or_404(item_id)
-        return item
+    def get(self, args, item_id):
+        """Get an item
+
+        The ETag starts with the item's version, which PUT checks in
+        If-Match.
+        """
+        only = fieldsets.resolve(ItemSchema, args)
+        item = db.one_or_404(select(ItemModel).options(
+            *fieldsets.load_options(ItemModel, only, ITEM_LOAD_OPTIONS),
+            undefer(ItemModel.version)).where(ItemModel.id == item_id))
+        return (fieldsets.Sparse(item, only),
+                {"ETag": item_etag(item.version, only)})
 
     def delete(self, item_id):
         """Delete an item"""
         item = ItemModel.query.get_or_404(item_id)
+        versions = item_versions(item)
         db.session.delete(item)
+        stats.item_removed(item.store_id, item.price)
+        feed.record("item", "delete", item_id, store_id=item.store_id)
         db.session.commit()
 
+        cache.invalidate(*versions)
+
         return {"messgae": "Item deleted"}
-    
+
+    @idempotent
     @bp.arguments(ItemUpdateSchema)
     @bp.response(200, ItemSchema)
+    @bp.alt_response(404, description="Item not found and not all of name, "
+                     "price and store_id were sent to create it.")
+    @bp.alt_response(409, description="Item kept changing concurrently.")
+    @bp.alt_response(412, description="Item version does not match If-Match.")
     def put(self, item_data, item_id):
-        "Update item in store"
-        item = ItemModel.query.get(item_id)
-        if item:
-            item.price = item_data["price"]
-            item.name = item_data["name"]
+        """Update an item, or create it if name, price and store_id are sent
 
-        else:
-            item = ItemModel(id=item_id, **item_data)
+        Only the fields sent are changed. With an If-Match header listing
+        item versions, as sent in the ETag of GET /item/<id>, the item is only
+        updated if its version is one of them. Retries sent with the same
+        Idempotency-Key are not reapplied.
+        """
+        if_match = request.if_match
+        versions = None
+        if if_match and not if_match.star_tag:
+            versions = if_match_versions(if_match)
 
-        db.session.add(item)
-        db.session.commit()
+        try:
+            for _ in range(PUT_ATTEMPTS):
+                row = update_item(item_id, item_data, versions)
+                if row is None and not if_match:
+                    row = insert_item(item_id, item_data)
+                if row is not None:
+                    break
+
+                version = db.session.scalar(
+                    select(ItemModel.version).where(ItemModel.id == item_id))
+                db.session.rollback()
+                if version is None:
+                    abort(412 if if_match else 404, message="Item not found.")
+                if versions is not None and version not in versions:
+                    abort(412, message="Item version does not match If-Match.")
+            else:
+                abort(409, message="Item was modified concurrently, "
+                      "try again.")
+
+            store_id, price, old_store_id, old_price = row
+            if old_store_id is None:
+                stats.item_added(store_id, price)
+            elif (store_id, price) != (old_store_id, old_price):
+                stats.item_removed(old_store_id, old_price)
+                stats.item_added(store_id, price)
+            feed.record("item", "update" if old_store_id else "create",
+                        item_id, store_id=store_id)
+            db.session.commit()
+
+        except IntegrityError:
+            db.session.rollback()
+            abort(400, message="Item name is taken or store does not exist.")
 
+        item = db.session.scalars(select(ItemModel).options(
+            *ITEM_LOAD_OPTIONS).where(ItemModel.id == item_id)).one()
+        cache.invalidate(*item_versions(item), ("store", old_store_id))
         return item
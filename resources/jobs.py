@@ -0,0 +1,31 @@
+"""Defines endpoint for following background jobs"""
+from flask.views import MethodView
+from flask_jwt_extended import jwt_required
+from flask_smorest import Blueprint, abort
+from redis.exceptions import RedisError
+
+import fieldsets
+from jobs import queue
+from schema import FieldsetArgsSchema, JobSchema
+
+bp = Blueprint("Jobs", "jobs", description="Operations on jobs")
+
+
+@bp.route("/jobs/<string:job_id>")
+class Job(MethodView):
+    @jwt_required()
+    @bp.arguments(FieldsetArgsSchema, location="query")
+    @bp.response(200, JobSchema)
+    def get(self, args, job_id):
+        """Returns the status of a job and, once it succeeded, its result
+
+        status is queued, running, retrying, succeeded or failed.
+        """
+        try:
+            job = queue.get(job_id)
+        except RedisError:
+            abort(503, message="Job queue is unavailable.")
+
+        if job is None:
+            abort(404, message="Job not found.")
+        return fieldsets.Sparse(job, fieldsets.resolve(JobSchema, args))
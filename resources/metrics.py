@@ -0,0 +1,26 @@
+"""Defines endpoints reporting per-worker runtime metrics"""
+from flask import Response
+from flask.views import MethodView
+from flask_smorest import Blueprint
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from metrics import exposition
+from pools import pool_stats
+
+bp = Blueprint("Metrics", "metrics", description="Operations on metrics")
+
+
+@bp.route("/metrics/pools")
+class PoolMetrics(MethodView):
+    @bp.response(200)
+    def get(self):
+        """Database and redis pool usage of the worker serving the request"""
+        return pool_stats()
+
+
+@bp.route("/metrics")
+class PrometheusMetrics(MethodView):
+    @bp.response(200, content_type=CONTENT_TYPE_LATEST)
+    def get(self):
+        """Request, SQL, serialization and redis metrics for Prometheus"""
+        return Response(exposition(), mimetype=CONTENT_TYPE_LATEST)
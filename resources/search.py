@@ -0,0 +1,32 @@
+"""Defines endpoint for searching items and tags by name"""
+from flask import current_app, request, url_for
+from flask.views import MethodView
+from flask_smorest import Blueprint
+
+import fieldsets
+from schema import SearchArgsSchema, SearchResultSchema
+from search import search
+
+bp = Blueprint("Search", "search", description="Operations on search")
+
+
+@bp.route("/search")
+class Search(MethodView):
+    @bp.arguments(SearchArgsSchema, location="query")
+    @bp.response(200, SearchResultSchema(many=True))
+    def get(self, args):
+        """Searches item and tag names by prefix or substring"""
+        limit = min(args.get("limit", current_app.config["ITEMS_PAGE_SIZE"]),
+                    current_app.config["ITEMS_MAX_PAGE_SIZE"])
+        results = search(args["q"], args["mode"], args["type"], limit,
+                         args["offset"])
+
+        headers = {}
+        if len(results) == limit:
+            next_args = {**request.args.to_dict(),
+                         "offset": args["offset"] + limit, "limit": limit}
+            next_url = url_for("Search.Search", **next_args)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+
+        return fieldsets.Sparse(
+            results, fieldsets.resolve(SearchResultSchema, args)), headers
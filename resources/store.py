@@ -3,50 +3,140 @@ from flask.views import MethodView
 from flask_smorest import Blueprint, abort
 from flask_jwt_extended import jwt_required
 
+from sqlalchemy import delete, exists, or_, select
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm import joinedload
 
+import cache
+import embedded
+import fieldsets
+from changes import feed
 from db import db
-from models import StoreModel
-from schema import StoreSchema
+from jobs import prefers_async, queue
+from models import ItemModel, ItemTags, StoreModel, StoreStatsModel, TagModel
+from schema import (FieldsetArgsSchema, JobSchema, StoreSchema,
+                    StoreStatsSchema)
 
 # Initialise module as blueprint
 bp = Blueprint("stores", __name__, description="Operations on stores")
 
+# Relationships dumped by StoreSchema, loaded in batches rather than per row
+STORE_LOAD_OPTIONS = (joinedload(StoreModel.stats),)
+
+# Collections dumped by StoreSchema, capped by embedded.load, and the fields
+# counting them
+STORE_COLLECTIONS = {"items": "item_count", "tags": "tag_count"}
+
+
+def load_options(only):
+    """Returns loader options for the fields in only but the collections"""
+    return fieldsets.load_options(StoreModel, only, STORE_LOAD_OPTIONS,
+                                  embedded.field_names(STORE_COLLECTIONS))
+
+
+@queue.task("store.delete")
+def delete_store(store_id):
+    """Deletes a store with its items, tags and their links
+
+    Runs a fixed number of statements and redis commands however large the
+    store: its items and tags are not loaded, the store's delete event stands
+    for theirs and every cached response is expired at once.
+    """
+    if not db.session.scalar(select(exists().where(
+            StoreModel.id == store_id))):
+        abort(404, message="Store not found.")
+
+    item_ids = select(ItemModel.id).where(ItemModel.store_id == store_id)
+    tag_ids = select(TagModel.id).where(TagModel.store_id == store_id)
+    links = or_(ItemTags.item_id.in_(item_ids), ItemTags.tag_id.in_(tag_ids))
+
+    try:
+        for statement in (
+                delete(ItemTags).where(links),
+                delete(ItemModel).where(ItemModel.store_id == store_id),
+                delete(TagModel).where(TagModel.store_id == store_id),
+                delete(StoreStatsModel).where(
+                    StoreStatsModel.store_id == store_id),
+                delete(StoreModel).where(StoreModel.id == store_id)):
+            db.session.execute(statement.execution_options(
+                synchronize_session=False))
+        feed.record("store", "delete", store_id)
+        db.session.commit()
+
+    except SQLAlchemyError:
+        abort(500, message="An error occured while deleting store.")
+
+    # Items of other stores may embed the deleted tags, and their tags the
+    # deleted items
+    cache.invalidate(cache.CASCADE)
+
+    return {"messgae": "store deleted"}
+
 
 @bp.route("/store/<int:store_id>")
 class Store(MethodView):
+    @cache.cached("store", "store_id")
+    @bp.arguments(FieldsetArgsSchema, location="query")
     @bp.response(200, StoreSchema)
-    def get(self, store_id):
+    def get(self, args, store_id):
         """Get a store"""
-        store = StoreModel.query.get_or_404(store_id)
-        return store
+        only = fieldsets.resolve(StoreSchema, args)
+        store = db.one_or_404(select(StoreModel).options(
+            *load_options(only)).where(StoreModel.id == store_id))
+        embedded.load([store], only, STORE_COLLECTIONS)
+        return fieldsets.Sparse(store, only)
 
     @jwt_required()
+    @bp.alt_response(202, schema=JobSchema, description="Deletion queued "
+                     "as a job, with `Prefer: respond-async`.")
     def delete(self, store_id):
-        """Delete a store"""
-        store = StoreModel.query.get_or_404(store_id)
-        db.session.delete(store)
-        db.session.commit()
+        """Delete a store with its items, tags and their links
+
+        Send `Prefer: respond-async` to delete it in a background job.
+        """
+        if prefers_async() and not db.session.scalar(select(exists().where(
+                StoreModel.id == store_id))):
+            abort(404, message="Store not found.")
+        return (queue.respond_async("store.delete", store_id=store_id)
+                or delete_store(store_id))
 
-        return {"messgae": "store deleted"}
+
+@bp.route("/store/<int:store_id>/stats")
+class StoreStats(MethodView):
+    @cache.cached("store", "store_id")
+    @bp.arguments(FieldsetArgsSchema, location="query")
+    @bp.response(200, StoreStatsSchema)
+    def get(self, args, store_id):
+        """Get item count, tag count and price statistics of a store"""
+        only = fieldsets.resolve(StoreStatsSchema, args)
+        return fieldsets.Sparse(db.one_or_404(select(StoreStatsModel).options(
+            *fieldsets.load_options(StoreStatsModel, only)).where(
+                StoreStatsModel.store_id == store_id)), only)
 
 
 @bp.route("/store")
 class StoreList(MethodView):
+    @cache.cached("catalog")
+    @bp.arguments(FieldsetArgsSchema, location="query")
     @bp.response(200, StoreSchema(many=True))
-    def get(self):
+    def get(self, args):
         """Returns all stores"""
-        store = StoreModel.query.all()
-        return store
+        only = fieldsets.resolve(StoreSchema, args)
+        stores = db.session.scalars(select(StoreModel).options(
+            *load_options(only))).all()
+        embedded.load(stores, only, STORE_COLLECTIONS)
+        return fieldsets.Sparse(stores, only)
 
     @jwt_required()
     @bp.arguments(StoreSchema)
     @bp.response(201, StoreSchema)
     def post(self, store_data):
         """Create a store"""
-        store = StoreModel(**store_data)
+        store = StoreModel(**store_data, stats=StoreStatsModel())
         try:
             db.session.add(store)
+            db.session.flush()
+            feed.record("store", "create", store.id)
             db.session.commit()
 
         except IntegrityError:
@@ -55,4 +145,5 @@ class StoreList(MethodView):
         except SQLAlchemyError:
             abort(500, message="An error occured while creating store.")
 
+        cache.invalidate(cache.CATALOG)
         return store
@@ -1,22 +1,145 @@
+from flask import current_app
 from flask_smorest import Blueprint, abort
 from flask.views import MethodView
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import delete, exists, insert, select, tuple_
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm import joinedload
 from flask_jwt_extended import jwt_required
 
-from db import db
-from models import TagModel, StoreModel, ItemModel
-from schema import TagSchema, TagAndItemSchema
+import cache
+import embedded
+import fieldsets
+import pagination
+import stats
+from changes import feed
+from db import UPSERT_DIALECTS, db
+from jobs import queue
+from models import TagModel, StoreModel, ItemModel, ItemTags
+from resources.item import bump_versions
+from schema import (TagSchema, TagAndItemSchema, ItemTagLinkBatchSchema,
+                    ItemTagLinkResultSchema, FieldsetArgsSchema, JobSchema,
+                    PageArgsSchema)
 
 bp = Blueprint("Tags", "tags", description="Operations on tags")
 
+# Relationships dumped by TagSchema, loaded in batches rather than per row
+TAG_LOAD_OPTIONS = (joinedload(TagModel.store),)
+
+# Collections dumped by TagSchema, capped by embedded.load, and the fields
+# counting them
+TAG_COLLECTIONS = {"items": "item_count"}
+
+
+def load_options(only):
+    """Returns loader options for the fields in only but the collections"""
+    return fieldsets.load_options(TagModel, only, TAG_LOAD_OPTIONS,
+                                  embedded.field_names(TAG_COLLECTIONS))
+
+
+def insert_links(pairs):
+    """Inserts (item_id, tag_id) links, returning those not already present"""
+    rows = [{"item_id": item_id, "tag_id": tag_id}
+            for item_id, tag_id in pairs]
+    dialect = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect is not None:
+        # Core table, as ORM inserts expect a returned row for every input
+        table = ItemTags.__table__
+        return set(db.session.execute(
+            dialect.insert(table).on_conflict_do_nothing().returning(
+                table.c.item_id, table.c.tag_id), rows).all())
+
+    existing = set(db.session.execute(
+        select(ItemTags.item_id, ItemTags.tag_id).where(
+            tuple_(ItemTags.item_id, ItemTags.tag_id).in_(pairs))).all())
+    rows = [row for row in rows
+            if (row["item_id"], row["tag_id"]) not in existing]
+    if rows:
+        db.session.execute(insert(ItemTags), rows)
+    return {(row["item_id"], row["tag_id"]) for row in rows}
+
+
+def delete_links(pairs):
+    """Deletes (item_id, tag_id) links, returning those that existed"""
+    condition = tuple_(ItemTags.item_id, ItemTags.tag_id).in_(pairs)
+    if db.session.get_bind().dialect.name in UPSERT_DIALECTS:
+        return set(db.session.execute(delete(ItemTags).where(
+            condition).returning(ItemTags.item_id, ItemTags.tag_id)).all())
+
+    existing = set(db.session.execute(
+        select(ItemTags.item_id, ItemTags.tag_id).where(condition)).all())
+    db.session.execute(delete(ItemTags).where(condition))
+    return existing
+
+
+# Change applied by each link operation, and the statuses of pairs it did
+# and did not change
+LINK_OPS = {"create": (insert_links, "linked", "already_linked"),
+            "delete": (delete_links, "unlinked", "not_linked")}
+
+
+@queue.task("links.apply")
+def apply_links(links, op):
+    """Creates or deletes item-tag links in one transaction
+
+    Returns the status of each distinct (item_id, tag_id) pair.
+    """
+    change, done, unchanged = LINK_OPS[op]
+    pairs = list(dict.fromkeys(
+        (link["item_id"], link["tag_id"]) for link in links))
+
+    item_stores = dict(db.session.execute(
+        select(ItemModel.id, ItemModel.store_id).where(
+            ItemModel.id.in_({item_id for item_id, _ in pairs}))).all())
+    tag_stores = dict(db.session.execute(
+        select(TagModel.id, TagModel.store_id).where(
+            TagModel.id.in_({tag_id for _, tag_id in pairs}))).all())
+    valid = [(item_id, tag_id) for item_id, tag_id in pairs
+             if item_id in item_stores and tag_id in tag_stores]
+
+    changed = set()
+    try:
+        if valid:
+            changed = change(valid)
+        bump_versions({item_id for item_id, _ in changed})
+        for item_id, tag_id in changed:
+            feed.record("link", op, item_id=item_id, tag_id=tag_id)
+        db.session.commit()
+
+    except SQLAlchemyError:
+        abort(500, message="An error occured while updating links.")
+
+    cache.invalidate(*(entity for item_id, tag_id in changed for entity in (
+        ("item", item_id), ("tag", tag_id), ("store", item_stores[item_id]),
+        ("store", tag_stores[tag_id]))))
+
+    results = []
+    for item_id, tag_id in pairs:
+        if item_id not in item_stores:
+            status = "item_not_found"
+        elif tag_id not in tag_stores:
+            status = "tag_not_found"
+        else:
+            status = done if (item_id, tag_id) in changed else unchanged
+        results.append({"item_id": item_id, "tag_id": tag_id,
+                        "status": status})
+    return results
+
 
 @bp.route("/store/<int:store_id>/tag")
 class TagInStore(MethodView):
+    @cache.cached("store", "store_id")
+    @bp.arguments(PageArgsSchema, location="query")
     @bp.response(200, TagSchema(many=True))
-    def get(self, store_id):
-        """Fetch tags associated with a store"""
-        store = StoreModel.query.get_or_404(store_id)
-        return store.tags.all()
+    def get(self, args, store_id):
+        """Fetch tags associated with a store, paginated by id"""
+        db.get_or_404(StoreModel, store_id)
+        only = fieldsets.resolve(TagSchema, args)
+        tags, headers = pagination.paginate(
+            select(TagModel).options(*load_options(only)).where(
+                TagModel.store_id == store_id),
+            TagModel.id, args, "Tags.TagInStore", store_id=store_id)
+        embedded.load(tags, only, TAG_COLLECTIONS)
+        return fieldsets.Sparse(tags, only), headers
 
     @bp.arguments(TagSchema)
     @bp.response(201, TagSchema)
@@ -28,21 +151,30 @@ class TagInStore(MethodView):
         tag = TagModel(**tag_data, store_id=store_id)
         try:
             db.session.add(tag)
+            stats.tags_changed(store_id, 1)
+            db.session.flush()
+            feed.record("tag", "create", tag.id, store_id=store_id)
             db.session.commit()
 
         except SQLAlchemyError as err:
             abort(500, message=str(err))
 
+        cache.invalidate(cache.CATALOG, ("store", store_id))
         return tag
 
 
 @bp.route("/tag/<int:tag_id>")
 class Tag(MethodView):
+    @cache.cached("tag", "tag_id")
+    @bp.arguments(FieldsetArgsSchema, location="query")
     @bp.response(200, TagSchema)
-    def get(self, tag_id):
+    def get(self, args, tag_id):
         """Fetch details about tag"""
-        tag = TagModel.query.get_or_404(tag_id)
-        return tag
+        only = fieldsets.resolve(TagSchema, args)
+        tag = db.one_or_404(select(TagModel).options(
+            *load_options(only)).where(TagModel.id == tag_id))
+        embedded.load([tag], only, TAG_COLLECTIONS)
+        return fieldsets.Sparse(tag, only)
 
     @jwt_required()
     @bp.response(202,
@@ -52,11 +184,23 @@ class Tag(MethodView):
     @bp.alt_response(400, description="Returned if tag is assigned to one or more items. In that case, tag is not deleted.")
     def delete(self, tag_id):
         """Delete Tag"""
-        tag = TagModel.query.get_or_404(tag_id)
+        store_id = db.session.scalar(
+            select(TagModel.store_id).where(TagModel.id == tag_id))
+        if store_id is None:
+            abort(404, message="Tag not found.")
 
-        if not tag.items:
-            db.session.delete(tag)
+        # Checked in the DELETE itself so a concurrent link cannot slip in
+        deleted = db.session.execute(delete(TagModel).where(
+            TagModel.id == tag_id,
+            ~exists().where(ItemTags.tag_id == tag_id)).execution_options(
+                synchronize_session=False)).rowcount
+
+        if deleted:
+            stats.tags_changed(store_id, -1)
+            feed.record("tag", "delete", tag_id, store_id=store_id)
             db.session.commit()
+            cache.invalidate(cache.CATALOG, ("tag", tag_id),
+                             ("store", store_id))
             return {"message": "Tag deleted."}
 
         abort(400, message="Could not delete tag. Make sure tag is not associated with any items, then try again.")
@@ -76,11 +220,19 @@ class LinkTagsToItem(MethodView):
 
         try:
             db.session.add(item)
+            bump_versions([item_id])
+            feed.record("link", "create", item_id=item_id, tag_id=tag_id)
             db.session.commit()
 
+        except IntegrityError:
+            abort(400, message="Tag is already linked to item.")
+
         except SQLAlchemyError:
             abort(500, message="An error occured while inserting tag.")
 
+        cache.invalidate(("item", item_id), ("tag", tag_id),
+                         ("store", item.store_id), ("store", tag.store_id))
+        embedded.load([tag], None, TAG_COLLECTIONS)
         return tag
 
     @jwt_required()
@@ -94,10 +246,52 @@ class LinkTagsToItem(MethodView):
 
         try:
             db.session.add(item)
+            bump_versions([item_id])
+            feed.record("link", "delete", item_id=item_id, tag_id=tag_id)
             db.session.commit()
 
         except SQLAlchemyError:
             abort(500, message="An error occured while removing tag.")
 
+        cache.invalidate(("item", item_id), ("tag", tag_id),
+                         ("store", item.store_id), ("store", tag.store_id))
+        embedded.load([tag], None, TAG_COLLECTIONS)
+
         return {"message": "Item removed from tag", "item": item,
                 "tag": tag}
+
+
+@bp.route("/item/tags")
+class LinkTagsToItems(MethodView):
+
+    def _apply(self, links, op):
+        pairs = {(link["item_id"], link["tag_id"]) for link in links}
+        if len(pairs) > current_app.config["BULK_CHUNK_SIZE"]:
+            abort(400, message="Send at most "
+                  f"{current_app.config['BULK_CHUNK_SIZE']} links at once.")
+        return (queue.respond_async("links.apply", links=links, op=op)
+                or apply_links(links, op))
+
+    @jwt_required()
+    @bp.arguments(ItemTagLinkBatchSchema)
+    @bp.response(200, ItemTagLinkResultSchema(many=True))
+    @bp.alt_response(202, schema=JobSchema, description="Links queued as a "
+                     "job, with `Prefer: respond-async`.")
+    def post(self, link_data):
+        """Link many tags to items, reporting the outcome of each pair
+
+        Send `Prefer: respond-async` to link them in a background job.
+        """
+        return self._apply(link_data["links"], "create")
+
+    @jwt_required()
+    @bp.arguments(ItemTagLinkBatchSchema)
+    @bp.response(200, ItemTagLinkResultSchema(many=True))
+    @bp.alt_response(202, schema=JobSchema, description="Links queued as a "
+                     "job, with `Prefer: respond-async`.")
+    def delete(self, link_data):
+        """Unlink many tags from items, reporting the outcome of each pair
+
+        Send `Prefer: respond-async` to unlink them in a background job.
+        """
+        return self._apply(link_data["links"], "delete")
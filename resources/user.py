@@ -1,26 +1,41 @@
 """Module contains code for user blueprint"""
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
-from passlib.hash import pbkdf2_sha256
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt
+from redis.exceptions import RedisError
 
-from db import db, redis
+import fieldsets
+from blocklist import blocklist
+from db import db
+from hashing import hasher, PasswordHasherBusy
 from models import UserModel
-from schema import UserSchema
+from schema import FieldsetArgsSchema, UserSchema
 
 bp = Blueprint("Users", "users", description="\
                Operations on users")
 
 
+@bp.errorhandler(PasswordHasherBusy)
+def hasher_busy(error):
+    return {"code": 429, "status": "Too Many Requests",
+            "message": "Server is busy, try again shortly."}, 429, \
+        {"Retry-After": "1"}
+
+
 @bp.route('/user/<int:user_id>')
 class Users(MethodView):
 
+    @bp.arguments(FieldsetArgsSchema, location="query")
     @bp.response(200, UserSchema)
-    def get(self, user_id):
+    def get(self, args, user_id):
         """Fetch User"""
-        user = UserModel.query.get_or_404(user_id)
-        return user
+        only = fieldsets.resolve(UserSchema, args)
+        user = db.one_or_404(select(UserModel).options(
+            *fieldsets.load_options(UserModel, only)).where(
+                UserModel.id == user_id))
+        return fieldsets.Sparse(user, only)
 
     @bp.response(200)
     def delete(self, user_id):
@@ -45,7 +60,7 @@ class RegisterUser(MethodView):
 
         user = UserModel(
             username=user_data["username"],
-            password=pbkdf2_sha256.hash(user_data["password"])
+            password=hasher.hash(user_data["password"])
         )
 
         try:
@@ -70,7 +85,17 @@ class UserLogin(MethodView):
         user = UserModel.query.filter(
             UserModel.username == user_data['username']).first()
 
-        if user and pbkdf2_sha256.verify(user_data["password"], user.password):
+        if user:
+            valid, new_hash = hasher.verify_and_update(
+                user_data["password"], user.password)
+        else:
+            valid, new_hash = False, None
+
+        if valid:
+            if new_hash:
+                user.password = new_hash
+                db.session.commit()
+
             access_token = create_access_token(identity=user.id)
             return {"access_token": access_token}
 
@@ -81,9 +106,12 @@ class UserLogin(MethodView):
 class UserLogout(MethodView):
     @jwt_required()
     def delete(self):
-        jti = get_jwt()["jti"]
+        token = get_jwt()
+
+        try:
+            blocklist.revoke(token["jti"], token["exp"])
 
-        from app import ACCESS_EXPIRES
+        except RedisError:
+            abort(503, message="Could not revoke token, try again.")
 
-        redis.set(jti, "", ex=ACCESS_EXPIRES)
         return {"message": "Successfully logged out."}
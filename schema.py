@@ -1,53 +1,222 @@
 """Defines schema and validations for RESTFUL API"""
-from marshmallow import Schema, fields
+from collections.abc import Mapping
+from functools import lru_cache
 
+from flask import current_app, has_app_context, url_for
+from marshmallow import Schema, fields, validate
 
-class PlainTagSchema(Schema):
+from embedded import total
+from fieldsets import Sparse
+from metrics import serialization_timer
+from serializers import compile_schema
+
+
+# Bounded, as fieldsets requested by clients each compile their own
+@lru_cache(maxsize=1024)
+def _compiled(schema_class, only, exclude):
+    return compile_schema(schema_class(only=only, exclude=exclude))
+
+
+@lru_cache(maxsize=1024)
+def _sparse(schema_class, only):
+    return schema_class(only=only)
+
+
+class BaseSchema(Schema):
+    def __init__(self, *, only=None, exclude=(), **kwargs):
+        super().__init__(only=only, exclude=exclude, **kwargs)
+        # Taken before marshmallow hands dotted names over to nested fields
+        self._compile_key = (None if only is None else frozenset(only),
+                             frozenset(exclude))
+
+    def _fast_dump(self):
+        """Returns the compiled dump function for this schema, if any"""
+        if has_app_context() and not current_app.config["FAST_SERIALIZER"]:
+            return None
+        return _compiled(type(self), *self._compile_key)
+
+    def dump(self, obj, *, many=None):
+        if isinstance(obj, Sparse):
+            if obj.only is not None:
+                return _sparse(type(self), obj.only).dump(
+                    obj.value, many=self.many if many is None else many)
+            obj = obj.value
+
+        with serialization_timer():
+            many = self.many if many is None else bool(many)
+            fast_dump = self._fast_dump()
+            if fast_dump is None:
+                return super().dump(obj, many=many)
+
+            if not many:
+                if isinstance(obj, Mapping):
+                    return super().dump(obj, many=many)
+                return fast_dump(obj)
+
+            objs = list(obj)
+            if objs and isinstance(objs[0], Mapping):
+                return super().dump(objs, many=many)
+            return [fast_dump(each) for each in objs]
+
+
+class PlainTagSchema(BaseSchema):
     id = fields.Int(dump_only=True)
     name = fields.Str()
 
 
-class PlainItemSchema(Schema):
+class PlainItemSchema(BaseSchema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True)
     price = fields.Float(required=True)
 
 
-class PlainStoreSchema(Schema):
+class PlainStoreSchema(BaseSchema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True)
 
 
-class ItemUpdateSchema(Schema):
+class ItemUpdateSchema(BaseSchema):
     name = fields.Str()
     price = fields.Float()
     store_id = fields.Int()
 
 
+class FieldsetArgsSchema(BaseSchema):
+    # Schema.fields is taken by marshmallow
+    fieldset = fields.Str(data_key="fields")
+    expand = fields.Str()
+
+
+class PageArgsSchema(FieldsetArgsSchema):
+    limit = fields.Int(validate=validate.Range(min=1))
+    after = fields.Int(validate=validate.Range(min=0))
+
+
+class ItemQueryArgsSchema(PageArgsSchema):
+    store_id = fields.Int()
+    min_price = fields.Float()
+    max_price = fields.Float()
+    tag_id = fields.Int()
+    stream = fields.Bool(load_default=False)
+
+
+class SearchArgsSchema(FieldsetArgsSchema):
+    q = fields.Str(required=True, validate=validate.Length(min=1, max=100))
+    mode = fields.Str(load_default="substring", validate=validate.OneOf(
+        ["prefix", "substring", "ranked"]))
+    type = fields.Str(load_default="all", validate=validate.OneOf(
+        ["all", "item", "tag"]))
+    limit = fields.Int(validate=validate.Range(min=1))
+    offset = fields.Int(load_default=0, validate=validate.Range(min=0))
+
+
+class SearchResultSchema(BaseSchema):
+    type = fields.Str()
+    id = fields.Int()
+    name = fields.Str()
+
+
+class ChangeArgsSchema(FieldsetArgsSchema):
+    since = fields.Str(load_default="0",
+                       validate=validate.Regexp(r"^\d+(-\d+)?$"))
+    limit = fields.Int(validate=validate.Range(min=1))
+
+
+class ChangeSchema(BaseSchema):
+    cursor = fields.Str()
+    entity = fields.Str()
+    op = fields.Str()
+    id = fields.Int()
+    store_id = fields.Int()
+    item_id = fields.Int()
+    tag_id = fields.Int()
+
+
+class JobSchema(BaseSchema):
+    id = fields.Str()
+    name = fields.Str()
+    status = fields.Str()
+    attempts = fields.Int()
+    error = fields.Str(allow_none=True)
+    result = fields.Raw(allow_none=True)
+    created_at = fields.DateTime()
+    updated_at = fields.DateTime()
+
+
 class ItemSchema(PlainItemSchema):
     store_id = fields.Int(required=True, load_only=True)
+    version = fields.Int(dump_only=True)
     store = fields.Nested(PlainStoreSchema(), dump_only=True)
     tags = fields.List(fields.Nested(PlainTagSchema(), dump_only=True))
 
 
+class ItemImportSchema(ItemSchema):
+    tag_ids = fields.List(fields.Int(), load_default=list, load_only=True)
+
+
+class ItemImportResultSchema(BaseSchema):
+    created = fields.Int()
+    errors = fields.List(fields.Dict())
+
+
+class StoreStatsSchema(BaseSchema):
+    item_count = fields.Int()
+    tag_count = fields.Int()
+    price_min = fields.Float()
+    price_max = fields.Float()
+    price_avg = fields.Float()
+
+
+# items and tags hold the first NESTED_COLLECTION_LIMIT by id, the counts
+# and URLs their total size and where to page through all of them
 class StoreSchema(PlainStoreSchema):
+    stats = fields.Nested(StoreStatsSchema(), dump_only=True)
     items = fields.List(fields.Nested(PlainItemSchema(), dump_only=True))
     tags = fields.List(fields.Nested(PlainTagSchema(), dump_only=True))
+    item_count = fields.Function(total("items"), dump_only=True,
+                                 metadata={"collection": "items"})
+    tag_count = fields.Function(total("tags"), dump_only=True,
+                                metadata={"collection": "tags"})
+    items_url = fields.Function(
+        lambda store: url_for("items.ItemInStore", store_id=store.id),
+        dump_only=True, metadata={"collection": "items"})
+    tags_url = fields.Function(
+        lambda store: url_for("Tags.TagInStore", store_id=store.id),
+        dump_only=True, metadata={"collection": "tags"})
 
 
 class TagSchema(PlainTagSchema):
     store_id = fields.Int(load_only=True)
     store = fields.Nested(PlainStoreSchema(), dump_only=True)
     items = fields.List(fields.Nested(PlainItemSchema(), dump_only=True))
+    item_count = fields.Function(total("items"), dump_only=True,
+                                 metadata={"collection": "items"})
+    items_url = fields.Function(
+        lambda tag: url_for("items.ItemInTag", tag_id=tag.id),
+        dump_only=True, metadata={"collection": "items"})
+
+
+class ItemTagLinkSchema(BaseSchema):
+    item_id = fields.Int(required=True)
+    tag_id = fields.Int(required=True)
+
+
+class ItemTagLinkBatchSchema(BaseSchema):
+    links = fields.List(fields.Nested(ItemTagLinkSchema()), required=True,
+                        validate=validate.Length(min=1))
+
+
+class ItemTagLinkResultSchema(ItemTagLinkSchema):
+    status = fields.Str()
 
 
-class TagAndItemSchema(Schema):
+class TagAndItemSchema(BaseSchema):
     message = fields.Str()
     item = fields.Nested(ItemSchema)
     tag = fields.Nested(TagSchema)
 
 
-class UserSchema(Schema):
+class UserSchema(BaseSchema):
     id = fields.Int(dump_only=True)
     username = fields.Str(required=True)
     password = fields.Str(required=True, load_only=True)
@@ -0,0 +1,134 @@
+"""Name search over items and tags
+
+On SQLite, names are indexed in an FTS5 table using the trigram tokenizer,
+kept in sync with items and tags by triggers. Item rows are stored under
+rowid 2 * id and tag rows under 2 * id + 1. On Postgres, items.name and
+tags.name carry pg_trgm GIN indexes (see migrations) and are queried
+directly. Other databases fall back to scanning with LIKE.
+"""
+from sqlalchemy import event, func, literal, select, text, union_all
+
+from db import db
+from models import ItemModel, TagModel
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index "
+    "USING fts5(name, tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS items_search_insert AFTER INSERT ON items "
+    "BEGIN INSERT INTO search_index(rowid, name) "
+    "VALUES (new.id * 2, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS items_search_update "
+    "AFTER UPDATE OF name ON items "
+    "BEGIN UPDATE search_index SET name = new.name "
+    "WHERE rowid = new.id * 2; END",
+    "CREATE TRIGGER IF NOT EXISTS items_search_delete AFTER DELETE ON items "
+    "BEGIN DELETE FROM search_index WHERE rowid = old.id * 2; END",
+    "CREATE TRIGGER IF NOT EXISTS tags_search_insert AFTER INSERT ON tags "
+    "BEGIN INSERT INTO search_index(rowid, name) "
+    "VALUES (new.id * 2 + 1, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS tags_search_update "
+    "AFTER UPDATE OF name ON tags "
+    "BEGIN UPDATE search_index SET name = new.name "
+    "WHERE rowid = new.id * 2 + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS tags_search_delete AFTER DELETE ON tags "
+    "BEGIN DELETE FROM search_index WHERE rowid = old.id * 2 + 1; END",
+]
+
+SQLITE_BACKFILL = (
+    "INSERT INTO search_index(rowid, name) "
+    "SELECT id * 2, name FROM items "
+    "UNION ALL SELECT id * 2 + 1, name FROM tags"
+)
+
+KINDS = {"item": 0, "tag": 1}
+
+
+@event.listens_for(db.metadata, "after_create")
+def create_sqlite_index(target, connection, **kwargs):
+    """Creates the FTS index when tables are created outside migrations"""
+    if connection.dialect.name != "sqlite":
+        return
+
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE name = 'search_index'")).first()
+    for statement in SQLITE_DDL:
+        connection.execute(text(statement))
+    if not exists:
+        connection.execute(text(SQLITE_BACKFILL))
+
+
+@event.listens_for(db.metadata, "before_drop")
+def drop_sqlite_index(target, connection, **kwargs):
+    """Drops the FTS index along with the tables it mirrors"""
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("DROP TABLE IF EXISTS search_index"))
+
+
+def _escape_like(query):
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _search_sqlite(query, mode, kind, limit, offset):
+    pattern = _escape_like(query)
+    conditions, order = [], ["rowid"]
+    params = {"prefix": f"{pattern}%", "substring": f"%{pattern}%",
+              "phrase": '"' + query.replace('"', '""') + '"',
+              "limit": limit, "offset": offset}
+
+    if mode == "prefix":
+        conditions.append("name LIKE :prefix ESCAPE '\\'")
+    elif len(query) < 3:
+        # Trigrams cannot match fewer than three characters
+        conditions.append("name LIKE :substring ESCAPE '\\'")
+    else:
+        conditions.append("search_index MATCH :phrase")
+        if mode == "ranked":
+            order = ["name LIKE :prefix ESCAPE '\\' DESC", "rank",
+                     "length(name)", "rowid"]
+    if kind in KINDS:
+        conditions.append(f"rowid % 2 = {KINDS[kind]}")
+
+    rows = db.session.execute(text(
+        "SELECT rowid, name FROM search_index "
+        f"WHERE {' AND '.join(conditions)} ORDER BY {', '.join(order)} "
+        "LIMIT :limit OFFSET :offset"), params)
+    return [{"type": "tag" if rowid % 2 else "item", "id": rowid // 2,
+             "name": name} for rowid, name in rows]
+
+
+def _search_tables(query, mode, kind, limit, offset):
+    pattern = _escape_like(query)
+    pattern = f"{pattern}%" if mode == "prefix" else f"%{pattern}%"
+    postgres = db.session.get_bind().dialect.name == "postgresql"
+
+    selects = []
+    for name, model in (("item", ItemModel), ("tag", TagModel)):
+        if kind in (name, "all"):
+            selects.append(select(
+                literal(name).label("type"), model.id.label("id"),
+                model.name.label("name")).where(
+                    model.name.ilike(pattern, escape="\\")))
+    results = union_all(*selects).subquery()
+
+    if mode == "ranked":
+        rank = func.similarity(results.c.name, query).desc() if postgres \
+            else func.length(results.c.name)
+        order = (results.c.name.ilike(f"{_escape_like(query)}%",
+                                      escape="\\").desc(), rank)
+    else:
+        order = (results.c.type, results.c.id)
+
+    rows = db.session.execute(select(results).order_by(*order)
+                              .limit(limit).offset(offset))
+    return [dict(row._mapping) for row in rows]
+
+
+def search(query, mode="substring", kind="all", limit=20, offset=0):
+    """Returns items and tags whose name matches query
+
+    mode is "prefix", "substring" or "ranked" (substring matches, best
+    first); kind is "item", "tag" or "all".
+    """
+    if db.session.get_bind().dialect.name == "sqlite":
+        return _search_sqlite(query, mode, kind, limit, offset)
+    return _search_tables(query, mode, kind, limit, offset)
@@ -0,0 +1,94 @@
+"""Compiles marshmallow schemas into specialised dump functions
+
+Marshmallow dumps by walking every field of every object through generic
+field and nested schema machinery. For the plain schemas in schema.py the
+result only depends on a fixed set of attributes, so each schema is turned
+once into generated Python that builds the same dict directly. Schemas using
+hooks or field types not handled here are left to marshmallow.
+"""
+import inspect
+
+from marshmallow import fields
+
+NUMBER_TYPES = {fields.Integer: "int", fields.Float: "float"}
+
+
+class Unsupported(Exception):
+    """Raised when a schema cannot be compiled"""
+
+
+class _Compiler:
+    def __init__(self):
+        self.namespace = {}
+        self.sources = []
+        self.counter = 0
+
+    def _name(self, prefix):
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def value(self, field, expression):
+        """Returns an expression serializing expression like field would"""
+        variable = self._name("_v")
+        if type(field) in NUMBER_TYPES and not field.as_string:
+            converted = f"{NUMBER_TYPES[type(field)]}({variable})"
+        elif type(field) is fields.String:
+            converted = f"str({variable})"
+        elif type(field) is fields.Nested and not field.many:
+            nested = field.schema
+            function = self.schema(nested)
+            if nested.many:
+                converted = f"[{function}(_x) for _x in {variable}]"
+            else:
+                converted = f"{function}({variable})"
+        elif type(field) is fields.List:
+            item = self._name("_i")
+            inner = self.value(field.inner, item)
+            converted = f"[{inner} for {item} in {variable}]"
+        else:
+            raise Unsupported(type(field).__name__)
+        return (f"(None if ({variable} := {expression}) is None "
+                f"else {converted})")
+
+    def function(self, field):
+        """Returns the name bound to a Function field's serialize function"""
+        func = field.serialize_func
+        if func is None or len(inspect.signature(func).parameters) != 1:
+            raise Unsupported("Function")
+        name = self._name("_f")
+        self.namespace[name] = func
+        return name
+
+    def schema(self, schema):
+        """Generates a function dumping one object, returning its name"""
+        if any(schema._hooks.values()):
+            raise Unsupported("hooks")
+
+        name = self._name("_dump")
+        entries = []
+        for field_name, field in schema.dump_fields.items():
+            key = field.data_key if field.data_key is not None else field_name
+            if type(field) is fields.Function:
+                entries.append(f"{key!r}: {self.function(field)}(obj)")
+                continue
+
+            attribute = field.attribute or field_name
+            if not attribute.isidentifier():
+                raise Unsupported(attribute)
+            entries.append(f"{key!r}: {self.value(field, f'obj.{attribute}')}")
+
+        self.sources.append(
+            f"def {name}(obj):\n    return {{{', '.join(entries)}}}\n")
+        return name
+
+
+def compile_schema(schema):
+    """Returns a function dumping one object like schema.dump, or None"""
+    compiler = _Compiler()
+    try:
+        name = compiler.schema(schema)
+    except Unsupported:
+        return None
+
+    exec("\n".join(compiler.sources), compiler.namespace)
+    return compiler.namespace[name]
@@ -0,0 +1,89 @@
+"""Incremental maintenance of the per-store aggregates in store_stats
+
+Each helper issues a single UPDATE in the caller's transaction, so the
+aggregates commit or roll back together with the change they describe.
+Minimum and maximum prices are only recomputed from items when the removed
+price was the current bound. `flask stats rebuild` recomputes everything.
+"""
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, delete, func, insert, literal, select, update
+
+from db import db
+from models import ItemModel, StoreModel, StoreStatsModel, TagModel
+
+Stats = StoreStatsModel
+
+
+def items_added(store_id, count, total, lowest, highest):
+    """Records count items with summed, lowest and highest prices"""
+    db.session.execute(update(Stats).where(Stats.store_id == store_id).values(
+        item_count=Stats.item_count + count,
+        price_sum=Stats.price_sum + total,
+        price_min=case((Stats.price_min.is_(None), lowest),
+                       (Stats.price_min > lowest, lowest),
+                       else_=Stats.price_min),
+        price_max=case((Stats.price_max.is_(None), highest),
+                       (Stats.price_max < highest, highest),
+                       else_=Stats.price_max),
+    ))
+
+
+def item_added(store_id, price):
+    items_added(store_id, 1, price, price, price)
+
+
+def item_removed(store_id, price):
+    """Records removal of an item, after it was deleted or repriced"""
+    db.session.flush()
+    prices = select(ItemModel.price).where(ItemModel.store_id == store_id)
+    db.session.execute(update(Stats).where(Stats.store_id == store_id).values(
+        item_count=Stats.item_count - 1,
+        price_sum=Stats.price_sum - price,
+        price_min=case((Stats.price_min >= price,
+                        prices.with_only_columns(func.min(ItemModel.price))
+                        .scalar_subquery()),
+                       else_=Stats.price_min),
+        price_max=case((Stats.price_max <= price,
+                        prices.with_only_columns(func.max(ItemModel.price))
+                        .scalar_subquery()),
+                       else_=Stats.price_max),
+    ))
+
+
+def tags_changed(store_id, count):
+    db.session.execute(update(Stats).where(Stats.store_id == store_id).values(
+        tag_count=Stats.tag_count + count))
+
+
+def rebuild():
+    """Recomputes all aggregates from items and tags"""
+    items = select(ItemModel.store_id, func.count().label("count"),
+                   func.sum(ItemModel.price).label("total"),
+                   func.min(ItemModel.price).label("lowest"),
+                   func.max(ItemModel.price).label("highest")) \
+        .group_by(ItemModel.store_id).subquery()
+    tags = select(TagModel.store_id, func.count().label("count")) \
+        .group_by(TagModel.store_id).subquery()
+
+    db.session.execute(delete(Stats))
+    db.session.execute(insert(Stats).from_select(
+        ["store_id", "item_count", "tag_count", "price_sum", "price_min",
+         "price_max"],
+        select(StoreModel.id,
+               func.coalesce(items.c.count, 0), func.coalesce(tags.c.count, 0),
+               func.coalesce(items.c.total, literal(0.0)),
+               items.c.lowest, items.c.highest)
+        .outerjoin(items, items.c.store_id == StoreModel.id)
+        .outerjoin(tags, tags.c.store_id == StoreModel.id)))
+
+
+cli = AppGroup("stats", help="Manage per-store aggregates.")
+
+
+@cli.command("rebuild")
+def rebuild_command():
+    """Recompute store_stats from items and tags."""
+    rebuild()
+    db.session.commit()
+    click.echo("Rebuilt store stats.")
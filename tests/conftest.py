@@ -0,0 +1,112 @@
+"""Fixtures for the API tests
+
+Each test gets an app on an in-memory SQLite database with redis replaced by
+fakeredis, so the suite runs without services.
+"""
+import fakeredis
+import pytest
+from sqlalchemy import event, insert, select
+
+import stats
+from app import create_app
+from db import db, redis
+from models import ItemModel, ItemTags, StoreModel, TagModel
+
+
+class FakeRedis(fakeredis.FakeStrictRedis):
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        # A server per app, so tests do not see each other's keys
+        return cls(server=fakeredis.FakeServer())
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    """Configures apps created by the test to run without services"""
+    monkeypatch.setenv("JWT_KEY", "test")
+    monkeypatch.setenv("RATE_LIMIT_ENABLED", "false")
+    monkeypatch.setenv("HASH_POOL_SIZE", "0")
+    monkeypatch.setenv("PASSWORD_HASH_ROUNDS", "1000")
+    monkeypatch.setenv("JOBS_BROKER", "memory")
+    monkeypatch.setattr(redis, "provider_class", FakeRedis)
+    return monkeypatch
+
+
+@pytest.fixture
+def app(environment):
+    app = create_app("sqlite://")
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(client):
+    """Returns headers authenticating as a freshly registered user"""
+    client.post("/register", json={"username": "test", "password": "test"})
+    response = client.post("/login", json={"username": "test",
+                                           "password": "test"})
+    return {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+
+@pytest.fixture
+def queries(app):
+    """Collects the SQL statements executed while the test runs"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def seed(app):
+    """Returns a function adding stores with items, tags and links"""
+    def seed(stores, items_per_store, tags_per_store=0, links_per_item=0):
+        with app.app_context():
+            first = db.session.scalar(select(db.func.count(StoreModel.id)))
+            db.session.execute(insert(StoreModel), [
+                {"name": f"store-{first + store}"} for store in range(stores)])
+            store_ids = db.session.scalars(select(StoreModel.id).order_by(
+                StoreModel.id).offset(first)).all()
+            items = [{"name": f"item-{store_id}-{item}", "price": item,
+                      "store_id": store_id}
+                     for store_id in store_ids
+                     for item in range(items_per_store)]
+            tags = [{"name": f"tag-{tag}", "store_id": store_id}
+                    for store_id in store_ids for tag in range(tags_per_store)]
+            # An empty list would insert a single row of defaults
+            if items:
+                db.session.execute(insert(ItemModel), items)
+            if tags:
+                db.session.execute(insert(TagModel), tags)
+
+            tag_ids = {}
+            for tag_id, store_id in db.session.execute(
+                    select(TagModel.id, TagModel.store_id).where(
+                        TagModel.store_id.in_(store_ids))):
+                tag_ids.setdefault(store_id, []).append(tag_id)
+            links = [{"item_id": item_id, "tag_id": tag_id}
+                     for item_id, store_id in db.session.execute(
+                         select(ItemModel.id, ItemModel.store_id).where(
+                             ItemModel.store_id.in_(store_ids)))
+                     for tag_id in tag_ids.get(store_id, [])[:links_per_item]]
+            if links:
+                db.session.execute(insert(ItemTags), links)
+            stats.rebuild()
+            db.session.commit()
+            return store_ids
+
+    return seed
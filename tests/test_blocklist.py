@@ -0,0 +1,39 @@
+"""Revoked token cache"""
+import time
+
+import pytest
+from redis.exceptions import RedisError
+
+from blocklist import blocklist
+from db import redis
+
+
+def test_revocation_received_during_lookup_is_kept(app):
+    exp = time.time() + 60
+    with app.app_context():
+        redis_get = redis.get
+
+        def get(jti):
+            # Published by another worker after this one read redis
+            value = redis_get(jti)
+            blocklist._on_message({"data": jti.encode()})
+            return value
+
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setattr(redis._redis_client, "get", get)
+            assert blocklist.is_revoked("raced", exp) is False
+
+        assert blocklist.is_revoked("raced", exp) is True
+
+
+def test_failed_revocation_is_not_cached(app):
+    def fail(*args, **kwargs):
+        raise RedisError
+
+    with app.app_context():
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setattr(redis._redis_client, "set", fail)
+            with pytest.raises(RedisError):
+                blocklist.revoke("unsaved", time.time() + 60)
+
+        assert blocklist.is_revoked("unsaved", time.time() + 60) is False
@@ -0,0 +1,56 @@
+"""Response cache"""
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/store/{store_id}/item",
+                                  "/store/{store_id}/tag",
+                                  "/tag/{tag_id}/item"])
+def test_cached_pages_keep_their_link(client, seed, path):
+    store_id, = seed(1, 3, tags_per_store=3, links_per_item=1)
+    path = path.format(store_id=store_id, tag_id=1) + "?limit=2"
+
+    first = client.get(path)
+    second = client.get(path)
+
+    assert first.headers["Link"] == second.headers["Link"]
+    assert second.get_json() == first.get_json()
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_linking_a_tag_of_another_store_refreshes_the_items_store(
+        client, auth, seed):
+    store_a, store_b = seed(2, 1, tags_per_store=2)
+    item = client.get(f"/store/{store_a}/item").get_json()[0]
+    tag_a, tag_b = client.get(f"/store/{store_b}/tag").get_json()
+
+    client.post(f"/item/{item['id']}/tag/{tag_a['id']}", headers=auth)
+    client.post("/item/tags", headers=auth, json={
+        "links": [{"item_id": item["id"], "tag_id": tag_b["id"]}]})
+
+    tags = client.get(f"/store/{store_a}/item").get_json()[0]["tags"]
+    assert [tag["id"] for tag in tags] == [tag_a["id"], tag_b["id"]]
+
+
+def test_deleting_a_store_expires_what_embeds_its_children(
+        client, auth, seed, queries):
+    kept, deleted = seed(2, 3, tags_per_store=1)
+    item = client.get(f"/store/{kept}/item").get_json()[0]
+    tag = client.get(f"/store/{deleted}/tag").get_json()[0]
+    client.post(f"/item/{item['id']}/tag/{tag['id']}", headers=auth)
+    paths = [f"/store/{kept}/item", f"/item/{item['id']}",
+             f"/tag/{tag['id']}", f"/store/{deleted}"]
+    assert all(client.get(path).status_code == 200 for path in paths)
+
+    queries.clear()
+    client.delete(f"/store/{deleted}", headers=auth)
+
+    # Neither the deleted items and tags nor their links are read
+    assert not any(query.lstrip().startswith("SELECT")
+                   and "FROM items" in query for query in queries), queries
+    assert client.get(f"/store/{kept}/item").get_json()[0]["tags"] == []
+    assert client.get(f"/item/{item['id']}").get_json()["tags"] == []
+    assert client.get(f"/tag/{tag['id']}").status_code == 404
+    assert client.get(f"/store/{deleted}").status_code == 404
+    changes = client.get("/changes").get_json()
+    assert [(change["entity"], change["op"]) for change in changes
+            if change["op"] == "delete"] == [("store", "delete")]
@@ -0,0 +1,37 @@
+"""Collections embedded in store and tag responses"""
+import pytest
+
+
+@pytest.fixture
+def tag(app, seed):
+    app.config["NESTED_COLLECTION_LIMIT"] = 2
+    seed(1, 5, tags_per_store=1, links_per_item=1)
+    seed(1, 1)
+    return 1
+
+
+def test_get_caps_items(client, tag):
+    response = client.get(f"/tag/{tag}").get_json()
+
+    assert [item["id"] for item in response["items"]] == [1, 2]
+    assert response["item_count"] == 5
+    assert response["items_url"] == f"/tag/{tag}/item"
+
+
+@pytest.mark.parametrize("method", ["post", "delete"])
+def test_link_responses_cap_items(client, auth, queries, tag, method):
+    if method == "delete":
+        client.post(f"/item/6/tag/{tag}", headers=auth)
+    queries.clear()
+
+    response = getattr(client, method)(f"/item/6/tag/{tag}", headers=auth)
+
+    assert response.status_code in (200, 201)
+    body = response.get_json()
+    body = body["tag"] if method == "delete" else body
+    assert [item["id"] for item in body["items"]] == [1, 2]
+    assert body["item_count"] == (6 if method == "post" else 5)
+    assert body["items_url"] == f"/tag/{tag}/item"
+    # The tag's whole collection is never loaded
+    assert not [statement for statement in queries
+                if "? = item_tags.tag_id" in statement], queries
@@ -0,0 +1,41 @@
+"""Response encoding"""
+import pytest
+
+
+def test_validation_errors_with_list_indexes_are_422(client, auth):
+    response = client.post("/item/tags", headers=auth, json={
+        "links": [{"item_id": 1, "tag_id": 1}, {"item_id": "x"}]})
+
+    assert response.status_code == 422
+    errors = response.get_json()["errors"]["json"]["links"]
+    assert set(errors["1"]) == {"item_id", "tag_id"}
+
+
+def test_import_reports_nested_list_errors(client, seed):
+    store_id, = seed(1, 0)
+    body = (f'{{"name": "good", "price": 1, "store_id": {store_id}}}\n'
+            f'{{"name": "bad", "price": 1, "store_id": {store_id}, '
+            f'"tag_ids": ["a"]}}\n')
+
+    response = client.post("/item/bulk", data=body,
+                           content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    assert response.get_json() == {"created": 1, "errors": [
+        {"row": 2, "errors": {"tag_ids": {"0": ["Not a valid integer."]}}}]}
+
+
+@pytest.mark.parametrize("accept", ["application/json", "application/msgpack"])
+def test_negotiated_responses_vary_on_accept(client, seed, accept):
+    seed(1, 1)
+    # The item is smaller than COMPRESS_MIN_SIZE; the second GET is cached
+    responses = [client.get("/item/1", headers={"Accept": accept})
+                 for _ in range(2)]
+    responses.append(client.get("/item/999", headers={"Accept": accept}))
+    headers = {"Idempotency-Key": "vary", "Accept": accept}
+    responses.extend(client.put("/item/1", json={"price": 5}, headers=headers)
+                     for _ in range(2))
+
+    assert responses[4].headers["Idempotent-Replayed"] == "true"
+    for response in responses:
+        assert "Accept" in response.vary, response.status_code
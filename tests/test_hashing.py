@@ -0,0 +1,40 @@
+"""Password hashing pool"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from hashing import PasswordHasher, PasswordHasherBusy
+
+
+def slow(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(SimpleNamespace(config={
+        "PASSWORD_HASH_ROUNDS": 1000, "HASH_POOL_SIZE": 1,
+        "HASH_QUEUE_DEPTH": 3, "HASH_TIMEOUT": 0.1}))
+    yield hasher
+    hasher._executor.shutdown(cancel_futures=True)
+
+
+def free_slots(hasher):
+    count = 0
+    while hasher._slots.acquire(blocking=False):
+        count += 1
+    for _ in range(count):
+        hasher._slots.release()
+    return count
+
+
+def test_timed_out_hashes_hold_their_slot_until_done(hasher):
+    with pytest.raises(PasswordHasherBusy):
+        hasher._run(slow, 1)
+
+    assert free_slots(hasher) == 2
+    time.sleep(1.2)
+    assert free_slots(hasher) == 3
+
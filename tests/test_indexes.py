@@ -0,0 +1,70 @@
+"""Lookups use indexes, checked with EXPLAIN QUERY PLAN on SQLite"""
+import re
+
+import pytest
+from sqlalchemy import event
+
+from db import db
+
+BY_STORE = r"SEARCH items USING INDEX ix_items_store_id_id \(store_id=\?"
+BY_TAG = (r"SEARCH item_tags USING COVERING INDEX "
+          r"ix_item_tags_tag_id_item_id \(tag_id=\?")
+BY_ITEM = r"SEARCH item_tags\w* USING COVERING INDEX \w+ \(item_id=\?\)"
+
+# (method, path, json, pattern some statement's plan must match)
+LOOKUPS = [
+    ("get", "/store/1", None, BY_STORE),
+    ("get", "/store/1/item", None, BY_STORE),
+    ("get", "/store/1/tag", None,
+     r"SEARCH tags USING INDEX ix_tags_store_id_id \(store_id=\?\)"),
+    ("post", "/store/1/tag", {"name": "new"},
+     r"SEARCH tags USING COVERING INDEX \w+ \(store_id=\? AND name=\?\)"),
+    ("get", "/item?store_id=1", None, BY_STORE),
+    ("get", "/item?tag_id=1", None, BY_TAG),
+    ("get", "/item/1", None, BY_ITEM),
+    ("get", "/tag/1", None, BY_TAG),
+    ("get", "/tag/1/item", None, BY_TAG),
+]
+
+# Tables never read in full; GET /item reads items in id order up to a limit
+FULL_SCAN = re.compile(r"^SCAN (items|tags|item_tags)\b")
+
+
+@pytest.fixture
+def plans(app, seed):
+    """Returns a function making a request and returning its query plans"""
+    app.config["RESPONSE_CACHE_ENABLED"] = False
+    seed(2, 5, tags_per_store=2, links_per_item=1)
+    with app.app_context():
+        engine = db.engine
+
+    def plans(method, path, json=None):
+        executed = []
+
+        def record(conn, cursor, statement, parameters, context,
+                   executemany):
+            executed.append((statement, parameters))
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = getattr(app.test_client(), method)(path, json=json)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert response.status_code < 300, response.get_json()
+
+        with app.app_context():
+            connection = db.session.connection()
+            return [[row[3] for row in connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters)]
+                for statement, parameters in executed]
+
+    return plans
+
+
+@pytest.mark.parametrize("method, path, json, pattern", LOOKUPS)
+def test_lookup_uses_index(plans, method, path, json, pattern):
+    details = [detail for plan in plans(method, path, json)
+               for detail in plan]
+
+    assert any(re.match(pattern, detail) for detail in details), details
+    assert not any(FULL_SCAN.match(detail) for detail in details), details
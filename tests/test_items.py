@@ -0,0 +1,72 @@
+"""Conditional and idempotent item updates"""
+import pytest
+
+
+@pytest.fixture
+def item(seed):
+    seed(1, 1)
+    return "/item/1"
+
+
+def test_put_accepts_the_etag_of_get(client, item):
+    etag = client.get(item).headers["ETag"]
+
+    updated = client.put(item, json={"price": 5}, headers={"If-Match": etag})
+    stale = client.put(item, json={"price": 6}, headers={"If-Match": etag})
+
+    assert updated.status_code == 200
+    assert stale.status_code == 412
+    assert client.get(item).headers["ETag"] != etag
+
+
+def test_get_is_not_modified_until_put(client, item):
+    etag = client.get(item).headers["ETag"]
+
+    assert client.get(item, headers={"If-None-Match": etag}).status_code == 304
+    client.put(item, json={"price": 5})
+    assert client.get(item, headers={"If-None-Match": etag}).status_code == 200
+
+
+@pytest.mark.parametrize("link", [
+    lambda client, auth: client.post("/item/1/tag/1", headers=auth),
+    lambda client, auth: client.post("/item/tags", headers=auth, json={
+        "links": [{"item_id": 1, "tag_id": 1}]}),
+], ids=["single", "batch"])
+def test_get_is_modified_by_tag_changes(client, auth, seed, link):
+    seed(1, 1, tags_per_store=1)
+    etag = client.get("/item/1").headers["ETag"]
+
+    link(client, auth)
+
+    linked = client.get("/item/1", headers={"If-None-Match": etag})
+    assert linked.status_code == 200
+    assert [tag["id"] for tag in linked.get_json()["tags"]] == [1]
+    client.delete("/item/1/tag/1", headers=auth)
+    assert client.get("/item/1", headers={
+        "If-None-Match": linked.headers["ETag"]}).status_code == 200
+
+
+def test_representations_are_tagged_apart(client, item):
+    json, sparse, msgpack = (
+        client.get(path, headers=headers).headers["ETag"]
+        for path, headers in ((item, {}), (item + "?fields=id", {}),
+                              (item, {"Accept": "application/msgpack"})))
+
+    assert len({json, sparse, msgpack}) == 3
+    assert client.get(item + "?fields=id", headers={
+        "If-None-Match": json}).status_code == 200
+    # Any representation's ETag names the version for PUT
+    assert client.put(item, json={"price": 5}, headers={
+        "If-Match": msgpack}).status_code == 200
+
+
+def test_idempotency_keys_belong_to_their_client(client, auth, item):
+    headers = {"Idempotency-Key": "retry-1"}
+
+    first = client.put(item, json={"price": 5}, headers=headers)
+    replay = client.put(item, json={"price": 5}, headers=headers)
+    other = client.put(item, json={"price": 5}, headers={**headers, **auth})
+
+    assert replay.headers.get("Idempotent-Replayed") == "true"
+    assert "Idempotent-Replayed" not in other.headers
+    assert other.get_json()["version"] == first.get_json()["version"] + 1
@@ -0,0 +1,178 @@
+"""Background jobs"""
+import time
+
+import pytest
+from flask_smorest import abort
+from redis.exceptions import RedisError
+
+import jobs
+from app import create_app
+from db import db, redis
+from jobs import queue
+
+
+@pytest.fixture
+def app(environment):
+    environment.setenv("JOB_MAX_ATTEMPTS", "3")
+    # Retries are due at once unless a test sets a backoff
+    environment.setenv("JOB_BACKOFF", "0")
+    app = create_app("sqlite://")
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def task(environment):
+    """Returns a function registering a task under a test name"""
+    def task(func):
+        environment.setitem(queue.tasks, "test." + func.__name__, func)
+        return "test." + func.__name__
+
+    return task
+
+
+def run(app, name, **kwargs):
+    with app.app_context():
+        job_id = queue.enqueue(name, **kwargs)
+        queue.work(burst=True)
+        return queue.get(job_id)
+
+
+def test_failed_jobs_are_retried(app, task):
+    calls = []
+
+    def flaky():
+        calls.append(None)
+        if len(calls) < 3:
+            raise ValueError("flaky")
+        return "done"
+
+    job = run(app, task(flaky))
+
+    assert job["status"] == "succeeded"
+    assert job["attempts"] == 3
+    assert (job["result"], job["error"]) == ("done", None)
+
+
+def test_jobs_fail_after_max_attempts(app, task):
+    def broken():
+        raise ValueError("broken")
+
+    job = run(app, task(broken))
+
+    assert (job["status"], job["attempts"]) == ("failed", 3)
+    assert job["error"] == "broken"
+
+
+def test_client_errors_fail_at_once(app, task):
+    def missing():
+        abort(404, message="Item not found.")
+
+    job = run(app, task(missing))
+
+    assert (job["status"], job["attempts"]) == ("failed", 1)
+    assert job["error"] == "Item not found."
+
+
+def test_unknown_jobs_fail(app):
+    job = run(app, "test.unknown")
+
+    assert job["status"] == "failed"
+    assert job["error"] == "Unknown job test.unknown."
+
+
+def test_retries_back_off(app, task, environment):
+    def broken():
+        raise ValueError("broken")
+
+    delays = []
+    environment.setattr(jobs.random, "uniform", lambda low, high: high)
+    environment.setattr(queue, "backoff", 2)
+    environment.setattr(queue, "max_backoff", 3)
+    environment.setattr(queue, "max_attempts", 4)
+    environment.setattr(queue.broker, "retry", lambda job_id, delay: (
+        delays.append(delay), queue.broker.queue.append(job_id)))
+
+    run(app, task(broken))
+
+    assert delays == [2, 3, 3]
+
+
+def test_async_requests_answer_with_the_job(app, client, auth, seed):
+    seed(1, 1, tags_per_store=1)
+
+    response = client.post("/item/tags", json={
+        "links": [{"item_id": 1, "tag_id": 1}]},
+        headers={**auth, "Prefer": "respond-async"})
+
+    assert response.status_code == 202
+    assert response.headers["Preference-Applied"] == "respond-async"
+    job = client.get(response.headers["Location"], headers=auth).get_json()
+    assert (job["status"], job["name"]) == ("queued", "links.apply")
+
+    with app.app_context():
+        queue.work(burst=True)
+
+    job = client.get(response.headers["Location"], headers=auth).get_json()
+    assert job["status"] == "succeeded"
+    assert job["result"] == [{"item_id": 1, "tag_id": 1, "status": "linked"}]
+
+
+def test_async_requests_are_served_synchronously_without_a_queue(
+        client, auth, seed, environment):
+    seed(1, 1, tags_per_store=1)
+
+    def unavailable(*args):
+        raise RedisError("unavailable")
+
+    environment.setattr(queue.broker, "add", unavailable)
+    response = client.post("/item/tags", json={
+        "links": [{"item_id": 1, "tag_id": 1}]},
+        headers={**auth, "Prefer": "respond-async"})
+
+    assert response.status_code == 200
+    assert response.get_json()[0]["status"] == "linked"
+
+
+def test_unknown_jobs_are_not_found(client, auth):
+    assert client.get("/jobs/unknown", headers=auth).status_code == 404
+
+
+@pytest.fixture
+def redis_app(environment):
+    environment.setenv("JOBS_BROKER", "redis")
+    environment.setenv("JOB_TIMEOUT", "1")
+    app = create_app("sqlite://")
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+def test_jobs_are_recorded_and_queued_together(redis_app, environment):
+    def unavailable(*args):
+        raise RedisError("unavailable")
+
+    # Only a push sent outside the enqueue transaction would fail
+    environment.setattr(redis._redis_client, "lpush", unavailable)
+    job_id = queue.enqueue("test.unknown")
+
+    assert redis.lrange(jobs.QUEUE, 0, -1) == [job_id.encode()]
+    assert queue.get(job_id)["status"] == "queued"
+
+
+def test_running_jobs_keep_their_lease(redis_app, task):
+    reserved = []
+
+    def slow():
+        time.sleep(1.5)
+        # Another worker looking for jobs after the first lease ran out
+        reserved.append(queue.broker.reserve())
+
+    job_id = queue.enqueue(task(slow))
+    queue.work(burst=True)
+
+    assert reserved == [None]
+    assert queue.get(job_id)["status"] == "succeeded"
@@ -0,0 +1,24 @@
+"""Request metrics"""
+import time
+
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from db import db
+
+
+def test_failed_statements_are_timed(app):
+    with app.test_request_context(), db.engine.connect() as connection:
+        g.request_started = time.perf_counter()
+        g.queries = []
+
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+        connection.execute(text("SELECT 1"))
+
+        assert g.db_statements == 2
+        assert [statement for statement, _ in g.queries] == [
+            "SELECT * FROM missing", "SELECT 1"]
+        assert "query_started" not in connection.info
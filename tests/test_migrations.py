@@ -0,0 +1,65 @@
+"""Alembic migrations"""
+import pytest
+from flask_migrate import check, downgrade, upgrade
+from sqlalchemy import text
+
+from app import create_app
+from db import db
+
+MIGRATIONS = "migrations"
+
+
+@pytest.fixture
+def app(environment, tmp_path):
+    environment.setenv("FLASK_RUN_FROM_CLI", "true")
+    environment.setenv("DB_CREATE_ALL", "false")
+    app = create_app(f"sqlite:///{tmp_path}/migrations.db")
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+def rows(query):
+    return db.session.execute(text(query)).all()
+
+
+def test_upgrade_merges_duplicate_tags(app):
+    upgrade(directory=MIGRATIONS, revision="57ee853e54af")
+    for statement in (
+            "INSERT INTO stores (id, name) VALUES (1, 's')",
+            "INSERT INTO items (id, name, price, store_id) "
+            "VALUES (1, 'a', 1, 1), (2, 'b', 1, 1)",
+            "INSERT INTO tags (id, name, store_id) "
+            "VALUES (1, 't', 1), (2, 't', 1), (3, 'u', 1)",
+            "INSERT INTO item_tags (item_id, tag_id) "
+            "VALUES (1, 1), (1, 2), (2, 2), (2, 3)"):
+        db.session.execute(text(statement))
+    db.session.commit()
+
+    upgrade(directory=MIGRATIONS, revision="8c1d2e3f4a5b")
+
+    assert rows("SELECT id, name FROM tags ORDER BY id") == [
+        (1, "t"), (3, "u")]
+    assert rows("SELECT item_id, tag_id FROM item_tags "
+                "ORDER BY item_id, tag_id") == [(1, 1), (2, 1), (2, 3)]
+
+
+def test_downgrade_and_upgrade_again(app):
+    upgrade(directory=MIGRATIONS)
+    downgrade(directory=MIGRATIONS, revision="base")
+    upgrade(directory=MIGRATIONS)
+
+    assert rows("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                "AND name = 'items_search_insert'")
+
+
+def test_autogenerate_skips_search_index(app, capfd):
+    upgrade(directory=MIGRATIONS)
+
+    # Exits when autogenerate detects any change, listing them in the log
+    try:
+        check(directory=MIGRATIONS)
+    except SystemExit:
+        pass
+
+    assert "search_index" not in capfd.readouterr().err
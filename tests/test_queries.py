@@ -0,0 +1,108 @@
+"""Reads issue a fixed number of queries however many rows they return,
+selecting just the columns their fieldset asks for"""
+import pytest
+from sqlalchemy import select
+
+from db import db
+from models import ItemModel, TagModel
+
+PATHS = [
+    "/store",
+    "/store/{store_id}",
+    "/store/{store_id}/stats",
+    "/store/{store_id}/tag",
+    "/store/{store_id}/item",
+    "/item",
+    "/item/{item_id}",
+    "/tag/{tag_id}",
+    "/tag/{tag_id}/item",
+]
+
+
+def ids(app, store_id):
+    with app.app_context():
+        return {"store_id": store_id,
+                "item_id": db.session.scalar(select(ItemModel.id).where(
+                    ItemModel.store_id == store_id).limit(1)),
+                "tag_id": db.session.scalar(select(TagModel.id).where(
+                    TagModel.store_id == store_id).limit(1))}
+
+
+def count(client, queries, path):
+    queries.clear()
+    response = client.get(path)
+    assert response.status_code == 200, response.get_json()
+    return len(queries)
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_query_count_does_not_grow_with_rows(app, client, queries, seed,
+                                             path):
+    app.config["RESPONSE_CACHE_ENABLED"] = False
+    small, = seed(1, 2, tags_per_store=1, links_per_item=1)
+    few = count(client, queries, path.format(**ids(app, small)))
+
+    large = seed(10, 30, tags_per_store=5, links_per_item=3)
+    many = count(client, queries, path.format(**ids(app, large[0])))
+
+    assert many == few, queries
+
+
+def sql(query):
+    return " ".join(query.split())
+
+
+# (path, how each statement it runs begins)
+SPARSE = [
+    ("/store?expand=", ["SELECT stores.id, stores.name FROM stores"]),
+    ("/item?fields=name",
+     ["SELECT items.id, items.name FROM items ORDER BY items.id"]),
+    ("/item?fields=name,tags.name",
+     ["SELECT items.id, items.name FROM items ORDER BY items.id",
+      "SELECT items_1.id AS items_1_id, tags.id AS tags_id, "
+      "tags.name AS tags_name FROM items AS items_1"]),
+    ("/tag/1?fields=name", ["SELECT tags.id, tags.name FROM tags"]),
+    ("/store/1?fields=name,items.name",
+     ["SELECT stores.id, stores.name FROM stores",
+      "SELECT anon_1.id, anon_1.name, anon_1.parent_id"]),
+]
+
+
+@pytest.mark.parametrize("path, statements", SPARSE,
+                         ids=[path for path, _ in SPARSE])
+def test_fieldsets_prune_the_sql(app, client, queries, seed, path,
+                                 statements):
+    app.config["RESPONSE_CACHE_ENABLED"] = False
+    seed(2, 3, tags_per_store=2, links_per_item=1)
+
+    count(client, queries, path)
+
+    assert len(queries) == len(statements), queries
+    for query, statement in zip(queries, statements):
+        assert sql(query).startswith(statement), query
+
+
+def test_embedded_fieldsets_prune_the_window_query(app, client, queries,
+                                                    seed):
+    app.config["RESPONSE_CACHE_ENABLED"] = False
+    seed(1, 3)
+
+    count(client, queries, "/store/1?fields=items.price")
+
+    ranked = sql(queries[-1])
+    assert "items.price AS price" in ranked
+    assert "items.name" not in ranked and "items.version" not in ranked
+
+
+@pytest.mark.parametrize("path, message", [
+    ("/item?fields=bogus", "Unknown field bogus."),
+    ("/item?expand=name", "Cannot expand name."),
+    ("/store?fields=items.tags", "Unknown field items.tags."),
+    ("/store?fields=items.tags.name", "Unknown field items.tags.name."),
+    ("/store?expand=items.tags", "Cannot expand items.tags."),
+])
+def test_invalid_fieldsets_are_rejected(client, path, message):
+    response = client.get(path)
+
+    assert response.status_code == 400
+    assert response.get_json()["message"] == message
@@ -0,0 +1,67 @@
+"""Read replica routing"""
+import pytest
+from flask_jwt_extended import decode_token
+
+from app import create_app
+from db import db, redis
+
+
+@pytest.fixture
+def app(environment):
+    environment.setenv("DATABASE_REPLICA_URLS", "sqlite://")
+    environment.setenv("PROXY_COUNT", "1")
+    app = create_app("sqlite://")
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def login(client, username):
+    client.post("/register", json={"username": username, "password": "test"})
+    response = client.post("/login", json={"username": username,
+                                           "password": "test"})
+    return response.get_json()["access_token"]
+
+
+def pins(app):
+    with app.app_context():
+        return {key.decode() for key in redis.keys("replica-pin:*")}
+
+
+def test_writes_pin_the_writing_user(app, client):
+    writer, reader = login(client, "writer"), login(client, "reader")
+    before = pins(app)
+
+    client.post("/store", json={"name": "s"},
+                headers={"Authorization": f"Bearer {writer}"})
+
+    with app.app_context():
+        writer_id = decode_token(writer)["sub"]
+        reader_id = decode_token(reader)["sub"]
+    assert pins(app) - before == {f"replica-pin:user:{writer_id}"}
+    assert f"replica-pin:user:{reader_id}" not in pins(app)
+
+
+def test_anonymous_writes_pin_the_forwarded_address(app, client):
+    client.post("/register", json={"username": "u", "password": "test"},
+                headers={"X-Forwarded-For": "203.0.113.7"})
+
+    assert pins(app) == {"replica-pin:ip:203.0.113.7"}
+
+
+def test_pinned_clients_bypass_the_response_cache(app, client):
+    token = login(client, "writer")
+    headers = {"Authorization": f"Bearer {token}"}
+    store_id = client.post("/store", json={"name": "s"},
+                           headers=headers).get_json()["id"]
+    with app.app_context():
+        # As stored by an unpinned client reading from a lagging replica
+        version = redis.get(f"version:store:{store_id}") or b"0"
+        redis.set(f"response:v2:application/json:/store/{store_id}/item?",
+                  version + b":stale:{}\n\"stale\"")
+
+    response = client.get(f"/store/{store_id}/item", headers=headers)
+
+    assert response.get_json() == []
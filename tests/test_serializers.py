@@ -0,0 +1,60 @@
+"""Compiled serializers produce the same bytes as marshmallow"""
+import pytest
+
+# GET endpoints not dumping a response schema
+UNSERIALIZED = {"Metrics.PrometheusMetrics", "Metrics.PoolMetrics", "static",
+                "api-docs.openapi_json", "api-docs.openapi_swagger_ui"}
+
+PATHS = {
+    "stores.StoreList": ["/store", "/store?expand=", "/store?expand=items",
+                         "/store?fields=name,items.name,item_count"],
+    "stores.Store": ["/store/1", "/store/1?fields=stats,tags"],
+    "stores.StoreStats": ["/store/1/stats"],
+    "Tags.TagInStore": ["/store/1/tag", "/store/1/tag?limit=1"],
+    "Tags.Tag": ["/tag/1", "/tag/1?expand=store"],
+    "items.ItemInStore": ["/store/1/item"],
+    "items.ItemInTag": ["/tag/1/item"],
+    "items.ItemList": ["/item", "/item?fields=name,tags.name",
+                       "/item?stream=true"],
+    "items.Item": ["/item/1", "/item/1?fields=version,store"],
+    "items.ItemExport": ["/item/export"],
+    "Search.Search": ["/search?q=item", "/search?q=item&fields=name"],
+    "Changes.Changes": ["/changes"],
+    "Jobs.Job": ["/jobs/{job_id}"],
+    "Users.Users": ["/user/1"],
+}
+
+
+def test_every_get_endpoint_is_compared(app):
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules()
+                 if "GET" in rule.methods}
+
+    assert endpoints - UNSERIALIZED == PATHS.keys()
+
+
+@pytest.fixture
+def catalog(app, client, auth, seed):
+    app.config["RESPONSE_CACHE_ENABLED"] = False
+    app.config["NESTED_COLLECTION_LIMIT"] = 3
+    seed(2, 5, tags_per_store=2, links_per_item=2)
+    # Writes feed GET /changes, and a queued job GET /jobs/<id>
+    client.post("/item", headers=auth, json={
+        "name": "extra", "price": 1.5, "store_id": 1})
+    response = client.post("/item/tags", json={
+        "links": [{"item_id": 1, "tag_id": 2}]},
+        headers={**auth, "Prefer": "respond-async"})
+    return {"job_id": response.get_json()["id"]}
+
+
+@pytest.mark.parametrize("path", [path for paths in PATHS.values()
+                                  for path in paths])
+def test_compiled_dump_matches_marshmallow(app, client, auth, catalog, path):
+    path = path.format(**catalog)
+
+    app.config["FAST_SERIALIZER"] = False
+    expected = client.get(path, headers=auth)
+    app.config["FAST_SERIALIZER"] = True
+    compiled = client.get(path, headers=auth)
+
+    assert expected.status_code == 200, expected.get_json()
+    assert compiled.get_data() == expected.get_data()